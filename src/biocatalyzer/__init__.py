@@ -1,2 +1,13 @@
-from .bioreactor import BioReactor
-from .matcher import MSDataMatcher
+# BioReactor and MSDataMatcher are imported lazily so that importing a submodule (e.g. the CLIs)
+# does not pull RDKit and pandas before they are needed.
+__all__ = ['BioReactor', 'MSDataMatcher']
+
+
+def __getattr__(name):
+    if name == 'BioReactor':
+        from .bioreactor import BioReactor
+        return BioReactor
+    if name == 'MSDataMatcher':
+        from .matcher import MSDataMatcher
+        return MSDataMatcher
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
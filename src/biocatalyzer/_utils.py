@@ -4,31 +4,6 @@ import numpy as np
 import pandas as pd
 
 
-def match_value(v: float, values: List[float], tol: float = 0.1):
-    """
-    Match a value with a list of values.
-
-    Parameters
-    ----------
-    v: float
-        The value to match.
-    values: List[float]
-        The list of values to match.
-    tol: float
-        The tolerance to match the values.
-
-    Returns
-    -------
-    tuple:
-        The indexes of the matched values.
-    """
-    indexes = []
-    for i, value in enumerate(values):
-        if value - tol <= v <= value + tol:
-            indexes.append(i)
-    return indexes
-
-
 def _empty_dfs(dfs: List[pd.DataFrame]):
     """
     Check if at least one dataframe is not empty.
@@ -4,7 +4,7 @@ import multiprocessing
 import os
 import time
 import uuid
-from typing import Union
+from typing import Optional, Tuple, Union
 
 import pandas as pd
 from tqdm import tqdm
@@ -15,6 +15,9 @@ from biocatalyzer.io_utils import Loaders
 
 DATA_FILES = os.path.dirname(__file__)
 
+NEW_COMPOUNDS_COLUMNS = ['OriginalCompoundID', 'OriginalCompoundSmiles', 'OriginalReactionRuleID', 'NewCompoundID',
+                         'NewCompoundSmiles', 'NewReactionSmiles', 'EC_Numbers']
+
 
 class BioReactor:
     """
@@ -31,7 +34,8 @@ class BioReactor:
                  molecules_to_remove_path: Union[str, None] = 'default',
                  patterns_to_remove_path: Union[str, None] = 'default',
                  min_atom_count: int = 5,
-                 n_jobs: int = 1):
+                 n_jobs: int = 1,
+                 batch_size: int = 0):
         """
         Initialize the BioReactor class.
 
@@ -55,6 +59,9 @@ class BioReactor:
             The minimum number of heavy atoms a product must have.
         n_jobs: int
             The number of jobs to run in parallel.
+        batch_size: int
+            The number of (compound, reaction rule) pairs sent to a worker at once.
+            If 0, it is set automatically based on the number of pairs and jobs.
         """
         # silence RDKit logger
         ChemUtils.rdkit_logs(False)
@@ -65,10 +72,12 @@ class BioReactor:
         self._reaction_rules_path = reaction_rules_path
         self._molecules_to_remove_path = molecules_to_remove_path
         self._patterns_to_remove_path = patterns_to_remove_path
+        self.batch_size = batch_size
+        # fail before loading the (large) input files if previous results would be overwritten
+        self._set_output_path(self._output_path)
         self._set_up_files()
         self._orgs = Loaders.load_organisms(self._organisms_path)
         self._reaction_rules = Loaders.load_reaction_rules(self._reaction_rules_path, orgs=self._orgs)
-        self._set_output_path(self._output_path)
         self._compounds = Loaders.load_compounds(self._compounds_path, self._neutralize)
         self._molecules_to_remove = Loaders.load_byproducts_to_remove(self._molecules_to_remove_path)
         self._patterns_to_remove = Loaders.load_patterns_to_remove(self._patterns_to_remove_path)
@@ -79,6 +88,7 @@ class BioReactor:
             self._n_jobs = n_jobs
         self._new_compounds_path = os.path.join(self._output_path, 'new_compounds.tsv')
         self._new_compounds = None
+        self._new_compounds_df: Optional[pd.DataFrame] = None
 
     @property
     def compounds(self):
@@ -391,6 +401,37 @@ class BioReactor:
             else:
                 self._n_jobs = n_jobs
 
+    @property
+    def batch_size(self):
+        """
+        Get the batch size used to send work to the parallel workers.
+
+        Returns
+        -------
+        int
+            The batch size (0 means it is set automatically).
+        """
+        return self._batch_size
+
+    @batch_size.setter
+    def batch_size(self, batch_size: int):
+        """
+        Set the batch size used to send work to the parallel workers.
+
+        Parameters
+        ----------
+        batch_size: int
+            The batch size (0 means it is set automatically).
+
+        Raises
+        ------
+        ValueError
+            If the batch size is negative.
+        """
+        if batch_size < 0:
+            raise ValueError(f'The batch size must be 0 or a positive integer (got {batch_size}).')
+        self._batch_size = batch_size
+
     def _set_up_files(self):
         if self._reaction_rules_path == 'default':
             self._reaction_rules_path = os.path.join(
@@ -410,12 +451,11 @@ class BioReactor:
         output_path: str
             The path to the output directory.
         """
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-        else:
-            if os.path.exists(output_path + '/results.tsv') or os.path.exists(output_path + '/new_compounds.tsv'):
-                raise FileExistsError(f"Results in {output_path} already exists. Define a different output path so "
-                                      f"that previous results are not overwritten.")
+        if os.path.exists(os.path.join(output_path, 'results.tsv')) or \
+                os.path.exists(os.path.join(output_path, 'new_compounds.tsv')):
+            raise FileExistsError(f"Results in {output_path} already exists. Define a different output path so "
+                                  f"that previous results are not overwritten.")
+        os.makedirs(output_path, exist_ok=True)
 
     def _match_patterns(self, smiles: str):
         """
@@ -433,7 +473,7 @@ class BioReactor:
         """
         if len(self._patterns_to_remove) == 0:
             return False
-        mol = ChemUtils.smiles_to_mol(smiles)
+        mol = ChemUtils.smiles_to_substructure_mol(smiles)
         if not mol:
             return True
         for bp in self._patterns_to_remove:
@@ -455,7 +495,8 @@ class BioReactor:
         bool
             True if mol has at least the minimum number of atoms, False otherwise.
         """
-        mol = ChemUtils.smiles_to_mol(smiles)
+        # the heavy atom count does not depend on sanitization
+        mol = ChemUtils.smiles_to_mol(smiles, sanitize=False)
         if not mol:
             return False
         if mol.GetNumHeavyAtoms() >= self._min_atom_count:
@@ -546,7 +587,11 @@ class BioReactor:
         Tuple[pd.DataFrame, str]
             The processed results and the path to the results file.
         """
-        results = pd.read_csv(self._new_compounds_path, sep='\t', header=0, lineterminator='\n')
+        if self._new_compounds_df is not None:
+            # reuse the products kept in memory by react() instead of parsing the file again
+            results = self._new_compounds_df.copy()
+        else:
+            results = Loaders.load_new_compounds(self._new_compounds_path)
         results.EC_Numbers = results.EC_Numbers.fillna('')
         results = results.groupby(['OriginalCompoundID', 'NewCompoundSmiles']).agg({'OriginalCompoundSmiles': 'first',
                                                                                     'OriginalReactionRuleID': ';'.join,
@@ -575,7 +620,6 @@ class BioReactor:
     def _react_single(self, smiles: str, smarts: str):
         """
         React a single compound with a single reaction rule.
-        Writes the results to the output files.
 
         Parameters
         ----------
@@ -583,10 +627,16 @@ class BioReactor:
             The smiles of the reactant.
         smarts: str
             The SMARTS string of the reaction.
+
+        Returns
+        -------
+        list
+            The new compounds as rows (tuples) in the order of the `new_compounds.tsv` columns.
         """
         reactants = self._reaction_rules[self._reaction_rules.SMARTS == smarts].Reactants.values[0]
         reactants = reactants.replace("Any", smiles).split(';')
         results = ChemUtils.react(reactants, smarts)
+        rows = []
         if len(results) > 0:
             smiles_id = self._compounds[self._compounds.smiles == smiles].compound_id.values[0]
             smarts_id = self._reaction_rules[self._reaction_rules.SMARTS == smarts].InternalID.values[0]
@@ -602,21 +652,49 @@ class BioReactor:
                         if self._neutralize:
                             most_similar_product = ChemUtils.uncharge_smiles(most_similar_product)
                         ecs = self._get_ec_numbers(smarts_id)
-                        with open(self._new_compounds_path, 'a') as f:
-                            f.write(f"{smiles_id}\t{smiles}\t{smarts_id}\t{smiles_id}_{uuid.uuid4()}\t"
-                                    f"{most_similar_product}\t{result}\t{ecs}\n")
+                        rows.append((smiles_id, smiles, smarts_id, f"{smiles_id}_{uuid.uuid4()}",
+                                     most_similar_product, result, ecs))
+        return rows
+
+    def _react_single_star(self, args: Tuple[str, str]):
+        """
+        Unpack a (smiles, smarts) pair and call `_react_single`.
+        Used with `Pool.imap`, which only passes a single argument.
+
+        Parameters
+        ----------
+        args: tuple
+            The smiles of the reactant and the SMARTS string of the reaction.
+
+        Returns
+        -------
+        list
+            The new compounds as rows (tuples).
+        """
+        return self._react_single(*args)
 
     def react(self):
         """
         Transform reactants into products using the reaction rules.
         """
         t0 = time.time()
-        with open(self._new_compounds_path, 'w') as f:
-            f.write('OriginalCompoundID\tOriginalCompoundSmiles\tOriginalReactionRuleID\tNewCompoundID\t'
-                    'NewCompoundSmiles\tNewReactionSmiles\tEC_Numbers\n')
-        params = list(itertools.product(self._compounds.smiles, self._reaction_rules.SMARTS))
+        # pairs are grouped by reaction rule so that each worker parses a rule once for all the compounds
+        params = [(smiles, smarts) for smarts, smiles in itertools.product(self._reaction_rules.SMARTS,
+                                                                           self._compounds.smiles)]
+        # large chunks amortize the pickling overhead of sending tasks to the workers
+        chunksize = self._batch_size or max(1, len(params) // (4 * self._n_jobs))
         with multiprocessing.Pool(self._n_jobs) as pool:
-            pool.starmap(self._react_single, tqdm(params, total=len(params)))
+            all_rows = []
+            # imap returns the results in the order of the pairs, so the output does not depend on the workers
+            for rows in tqdm(pool.imap(self._react_single_star, params, chunksize=chunksize), total=len(params)):
+                all_rows.extend(rows)
+        # rows grouped by compound (a stable sort, so the rows of each compound keep the reaction rules order)
+        compounds_order = {compound_id: i for i, compound_id in enumerate(self._compounds.compound_id)}
+        all_rows.sort(key=lambda row: compounds_order[row[0]])
+        # build a single DataFrame in the parent instead of writing from every task
+        new_compounds = pd.DataFrame(all_rows, columns=NEW_COMPOUNDS_COLUMNS)
+        new_compounds.to_csv(self._new_compounds_path, sep='\t', index=False)
+        self._new_compounds_df = new_compounds
         self._new_compounds = f"New products saved to {self._new_compounds_path}"
         t1 = time.time()
         logging.info(f"Time elapsed: {t1 - t0} seconds")
@@ -631,5 +709,5 @@ if __name__ == '__main__':
                     molecules_to_remove_path='data/byproducts_to_remove/byproducts.tsv',
                     min_atom_count=5,
                     n_jobs=12)
-    logging.basicConfig(filename=f'{output_path_}logging_bioreactor.log', level=logging.DEBUG)
+    logging.basicConfig(filename=os.path.join(output_path_, 'logging_bioreactor.log'), level=logging.DEBUG)
     br.react()
@@ -1,5 +1,8 @@
+from functools import lru_cache
 from typing import Union, List
 
+import numpy as np
+
 from rdkit import Chem, DataStructs, RDLogger
 from rdkit.Chem import MolFromSmiles, Mol, MolToSmiles, RemoveHs, AllChem, Descriptors
 from rdkit.Chem.Fingerprints.FingerprintMols import FingerprintMol
@@ -8,6 +11,23 @@ from rdkit.Chem.rdChemReactions import ReactionFromSmarts, ChemicalReaction
 
 from biocatalyzer.chem._utils import _correct_number_of_parenthesis
 
+_UNCHARGER = None
+
+
+def _get_uncharger():
+    """
+    Get the module level Uncharger, creating it on first use (once per process).
+
+    Returns
+    -------
+    Uncharger
+        The shared Uncharger instance.
+    """
+    global _UNCHARGER
+    if _UNCHARGER is None:
+        _UNCHARGER = Uncharger()
+    return _UNCHARGER
+
 
 class ChemUtils:
     """
@@ -35,7 +55,7 @@ class ChemUtils:
             return None
 
     @staticmethod
-    def smiles_to_mol(smiles: str):
+    def smiles_to_mol(smiles: str, sanitize: bool = True):
         """
         Converts a SMILES string to an RDKit molecule.
 
@@ -43,6 +63,9 @@ class ChemUtils:
         ----------
         smiles: str
             The SMILES string.
+        sanitize: bool
+            Whether to fully sanitize the molecule. Skipping sanitization avoids the expensive stereochemistry
+            perception when only the molecule topology is needed.
 
         Returns
         -------
@@ -50,11 +73,39 @@ class ChemUtils:
             The RDKit molecule.
         """
         try:
-            mol = MolFromSmiles(smiles)
+            mol = MolFromSmiles(smiles, sanitize=sanitize)
             return mol
         except :
             return None
 
+    @staticmethod
+    def smiles_to_substructure_mol(smiles: str):
+        """
+        Converts a SMILES string to an RDKit molecule ready for substructure matching.
+        Only ring perception, aromaticity and hybridization are sanitized, which is all the substructure search needs.
+
+        Parameters
+        ----------
+        smiles: str
+            The SMILES string.
+
+        Returns
+        -------
+        Mol
+            The RDKit molecule.
+        """
+        mol = ChemUtils.smiles_to_mol(smiles, sanitize=False)
+        if mol is None:
+            return None
+        try:
+            mol.UpdatePropertyCache(strict=False)
+            # hybridization (used by ^ queries) depends on the conjugation and the radicals
+            Chem.SanitizeMol(mol, sanitizeOps=Chem.SANITIZE_SYMMRINGS | Chem.SANITIZE_SETAROMATICITY |
+                             Chem.SANITIZE_SETCONJUGATION | Chem.SANITIZE_FINDRADICALS | Chem.SANITIZE_SETHYBRIDIZATION)
+            return mol
+        except ValueError:
+            return None
+
     @staticmethod
     def rdkit_logs(enable=False):
         if not enable:
@@ -81,9 +132,12 @@ class ChemUtils:
         return True
 
     @staticmethod
+    @lru_cache(maxsize=2 ** 8)
     def _smarts_to_reaction(reaction_smarts: str):
         """
         Converts a SMARTS string to a ChemicalReaction object.
+        Cached, as the same reaction is applied to every compound (parsing the SMARTS is the most expensive step of
+        `react` when the reactants do not match). The cache is small because parsed reactions take a lot of memory.
 
         Parameters
         ----------
@@ -167,9 +221,11 @@ class ChemUtils:
             The list of products.
         """
         if isinstance(smiles, str):
-            mol = (MolFromSmiles(smiles),)
-        else:
-            mol = [MolFromSmiles(s) for s in smiles]
+            smiles = [smiles]
+        # most compounds do not match the reaction templates, which is cheap to rule out with fingerprints
+        if not ChemUtils._may_react(smiles, smarts):
+            return []
+        mol = [ChemUtils._reactant_mol(s) for s in smiles]
         reaction = ChemUtils._smarts_to_reaction(smarts)
         if None in mol or reaction is None:
             return []
@@ -178,6 +234,94 @@ class ChemUtils:
         except ValueError:
             return []
 
+    @staticmethod
+    @lru_cache(maxsize=2 ** 14)
+    def _reactant_mol(smiles: str):
+        """
+        Parses the molecule of a reactant (also used to build the fingerprints).
+        The molecule is shared between calls, which is safe because the reactions only copy their reactants and the
+        fingerprints only read it.
+
+        Parameters
+        ----------
+        smiles: str
+            The molecule smiles.
+        Returns
+        -------
+        Mol
+            The molecule (None if the SMILES is not valid).
+        """
+        return MolFromSmiles(smiles)
+
+    @staticmethod
+    @lru_cache(maxsize=2 ** 14)
+    def _pattern_fingerprint(smiles: str):
+        """
+        Calculates the pattern fingerprint of a molecule (used to screen substructure matches).
+
+        Parameters
+        ----------
+        smiles: str
+            The molecule smiles.
+        Returns
+        -------
+        ExplicitBitVect
+            The pattern fingerprint (None if the SMILES is not valid).
+        """
+        mol = ChemUtils._reactant_mol(smiles)
+        if mol:
+            return Chem.PatternFingerprint(mol)
+        return None
+
+    @staticmethod
+    @lru_cache(maxsize=2 ** 8)
+    def _reactant_templates_fingerprints(reaction_smarts: str):
+        """
+        Calculates the pattern fingerprints of the reactant templates of a reaction.
+
+        Parameters
+        ----------
+        reaction_smarts: str
+            The SMARTS string of the reaction.
+        Returns
+        -------
+        list of ExplicitBitVect
+            The pattern fingerprints of the reactant templates (None if the SMARTS is not valid).
+        """
+        reaction = ChemUtils._smarts_to_reaction(reaction_smarts)
+        if reaction is None:
+            return None
+        return [Chem.PatternFingerprint(template) for template in reaction.GetReactants()]
+
+    @staticmethod
+    def _may_react(smiles: List[str], smarts: str):
+        """
+        Checks if the reactants can match the reactant templates of a reaction.
+        A molecule can only match a template if it has all the bits of the template pattern fingerprint, so a False
+        is exact while a True still requires running the reaction.
+
+        Parameters
+        ----------
+        smiles: List[str]
+            The smiles of the reactants' molecules.
+        smarts: str
+            The SMARTS string of the reaction.
+
+        Returns
+        -------
+        bool
+            False if some reactant cannot match its template, True otherwise.
+        """
+        templates_fps = ChemUtils._reactant_templates_fingerprints(smarts)
+        if templates_fps is None or len(templates_fps) != len(smiles):
+            # invalid reactions and reactant mismatches are handled when reacting
+            return True
+        for template_fp, s in zip(templates_fps, smiles):
+            fp = ChemUtils._pattern_fingerprint(s)
+            if fp is not None and not DataStructs.AllProbeBitsMatch(template_fp, fp):
+                return False
+        return True
+
     @staticmethod
     def _create_reaction_instances(rxn: ChemicalReaction, reactants: List[Mol]):
         """
@@ -197,14 +341,16 @@ class ChemUtils:
         """
         res = []
         ps = rxn.RunReactants(reactants)
+        # the reactants are the same for every product set (the templates are copied when added)
+        reactants_templates = [ChemUtils._remove_hs(reactant) for reactant in reactants] if ps else []
         for pset in ps:
             pset = [ChemUtils._sanitize_mol(pset_i) for pset_i in pset]
             if None not in pset:
                 tres = ChemicalReaction()
                 for p in pset:
                     tres.AddProductTemplate(ChemUtils._remove_hs(p))
-                for reactant in reactants:
-                    tres.AddReactantTemplate(ChemUtils._remove_hs(reactant))
+                for reactant in reactants_templates:
+                    tres.AddReactantTemplate(reactant)
                 res.append(tres)
         return list(set([AllChem.ReactionToSmiles(entry, canonical=True) for entry in res]))
 
@@ -224,8 +370,7 @@ class ChemUtils:
         """
         mol = MolFromSmiles(smiles)
         if mol:
-            uncharger = Uncharger()
-            return MolToSmiles(uncharger.uncharge(mol))
+            return MolToSmiles(_get_uncharger().uncharge(mol))
         return smiles
 
     @staticmethod
@@ -249,14 +394,54 @@ class ChemUtils:
 
     @staticmethod
     def match_masses(smiles, masses, mass_tolerance):
+        """
+        Checks if the exact mass of a molecule matches any of the given masses.
+
+        Parameters
+        ----------
+        smiles: str
+            The molecule smiles.
+        masses: List[float]
+            The masses to match (any mass matches if None).
+        mass_tolerance: float
+            The mass tolerance.
+        Returns
+        -------
+        Tuple[bool, float]
+            Whether the mass matches any of the masses and the exact mass of the molecule.
+        """
         mass = ChemUtils.calc_exact_mass(smiles)
         if masses is None:
             return True, mass
         if mass:
-            any_found = any(mass - mass_tolerance <= m <= mass + mass_tolerance for m in masses)
+            # all the masses are compared at once (missing masses never match)
+            masses = np.asarray(masses, dtype=float)
+            any_found = bool(((mass - mass_tolerance <= masses) & (masses <= mass + mass_tolerance)).any())
             return any_found, mass
         return False, mass
 
+    @staticmethod
+    @lru_cache(maxsize=2 ** 14)
+    def _fingerprint(smiles: str):
+        """
+        Calculates the fingerprint of a molecule.
+        Cached, as the same compound is compared with the products of every reaction rule it matches.
+        The fingerprints are only read by the similarity functions, so sharing them is safe.
+
+        Parameters
+        ----------
+        smiles: str
+            The molecule smiles.
+        Returns
+        -------
+        ExplicitBitVect
+            The molecule fingerprint (None if the SMILES is not valid).
+        """
+        mol = ChemUtils._reactant_mol(smiles)
+        if mol:
+            return FingerprintMol(mol)
+        return None
+
     @staticmethod
     def calc_fingerprint_similarity(smiles1: str, smiles2: str):
         """
@@ -273,11 +458,9 @@ class ChemUtils:
         float
             The similarity between the two molecules.
         """
-        mol1 = MolFromSmiles(smiles1)
-        mol2 = MolFromSmiles(smiles2)
-        if mol1 and mol2:
-            fp1 = FingerprintMol(mol1)
-            fp2 = FingerprintMol(mol2)
+        fp1 = ChemUtils._fingerprint(smiles1)
+        fp2 = ChemUtils._fingerprint(smiles2)
+        if fp1 is not None and fp2 is not None:
             return DataStructs.FingerprintSimilarity(fp1, fp2)
         return 0.0
 
@@ -302,6 +485,14 @@ class ChemUtils:
         smiles_list = [_correct_number_of_parenthesis(s) for s in smiles_list]
         if len(smiles_list) == 1:
             return smiles_list[0]
-        sims = [ChemUtils.calc_fingerprint_similarity(smiles, s) for s in smiles_list]
+        # the query fingerprint is computed once instead of once per candidate
+        fp = ChemUtils._fingerprint(smiles)
+        sims = [0.0] * len(smiles_list)
+        if fp is not None:
+            for i, s in enumerate(smiles_list):
+                s_fp = ChemUtils._fingerprint(s)
+                if s_fp is not None:
+                    # FingerprintSimilarity folds the longest fingerprint when the sizes differ
+                    sims[i] = DataStructs.FingerprintSimilarity(fp, s_fp)
         matching = sims.index(max(sims))
         return smiles_list[matching]
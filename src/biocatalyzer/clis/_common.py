@@ -0,0 +1,117 @@
+import logging
+import pathlib
+from typing import Any, Callable, List
+
+import click
+
+BIOREACTOR_OPTIONS = [
+    click.option("--neutralize",
+                 "neutralize",
+                 type=bool,
+                 default=False,
+                 help="Whether to neutralize input compounds and newly generated compounds.",
+                 ),
+    click.option("--reaction_rules",
+                 "reaction_rules",
+                 type=str,
+                 default='default',
+                 show_default=True,
+                 help="Path to reaction rules file.",
+                 ),
+    click.option("--organisms",
+                 "organisms",
+                 type=str,
+                 default=None,
+                 help="The path to the user defined file containing the organisms to filter the reaction rules.",
+                 ),
+    click.option("--patterns_to_remove",
+                 "patterns_to_remove",
+                 type=str,
+                 default='default',
+                 show_default=True,
+                 help="A user defined file containing SMARTS patterns. Products that match a pattern will be removed.",
+                 ),
+    click.option("--molecules_to_remove",
+                 "molecules_to_remove",
+                 type=str,
+                 default='default',
+                 show_default=True,
+                 help="A user defined file containing molecules encoded as SMILES to be removed from the products.",
+                 ),
+    click.option("--min_atom_count",
+                 "min_atom_count",
+                 type=int,
+                 default=5,
+                 show_default=True,
+                 help="The minimum atom count of a molecule (molecules with less atoms are removed from the products).",
+                 ),
+]
+
+TOLERANCE_OPTION = click.option("--tolerance",
+                                "tolerance",
+                                type=float,
+                                default=0.02,
+                                show_default=True,
+                                help="The mass tolerance to use when matching MS data.",
+                                )
+
+N_JOBS_OPTION = click.option("--n_jobs",
+                             "n_jobs",
+                             type=int,
+                             default=1,
+                             show_default=True,
+                             help="The number of jobs to run in parallel.",
+                             )
+
+BATCH_SIZE_OPTION = click.option("--batch_size",
+                                 "batch_size",
+                                 type=click.IntRange(min=0),
+                                 default=0,
+                                 show_default=True,
+                                 help="The number of (compound, reaction rule) pairs sent to each worker at once "
+                                      "(0 sets it automatically).",
+                                 )
+
+VERBOSE_OPTION = click.option("--verbose",
+                              "-v",
+                              "verbose",
+                              is_flag=True,
+                              default=False,
+                              help="Write debug messages to the log file.",
+                              )
+
+
+def setup_logging(output_path: pathlib.Path, verbose: bool = False):
+    """
+    Create the output directory and log to a file inside it.
+
+    Parameters
+    ----------
+    output_path: pathlib.Path
+        The path to the output directory.
+    verbose: bool
+        Whether to log debug messages (INFO and above are logged otherwise).
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+    logging.basicConfig(filename=output_path / 'logging.log', level=logging.DEBUG if verbose else logging.INFO)
+
+
+def add_options(options: List[Callable[..., Any]]):
+    """
+    Build a decorator that applies a list of click options to a command.
+
+    Parameters
+    ----------
+    options: List[Callable]
+        The click option decorators, in the order they should appear in the help message.
+
+    Returns
+    -------
+    Callable
+        The decorator applying all the options.
+    """
+    def decorator(f):
+        for option in reversed(options):
+            f = option(f)
+        return f
+    return decorator
@@ -1,9 +1,10 @@
-import logging
 import os
+import pathlib
 
 import click
 
-from biocatalyzer import BioReactor
+from biocatalyzer.clis._common import BIOREACTOR_OPTIONS, N_JOBS_OPTION, BATCH_SIZE_OPTION, VERBOSE_OPTION, \
+    add_options, setup_logging
 
 DATA_FILES = os.path.dirname(__file__)
 
@@ -14,56 +15,13 @@ DATA_FILES = os.path.dirname(__file__)
                 required=True,
                 )
 @click.argument("output_path",
-                type=click.Path(),
+                type=click.Path(file_okay=False, path_type=pathlib.Path, resolve_path=True),
                 required=True,
                 )
-@click.option("--neutralize",
-              "neutralize",
-              type=bool,
-              default=False,
-              help="Whether to neutralize input compounds and newly generated compounds.",
-              )
-@click.option("--reaction_rules",
-              "reaction_rules",
-              type=str,
-              default='default',
-              show_default=True,
-              help="Path to reaction rules file.",
-              )
-@click.option("--organisms",
-              "organisms",
-              type=str,
-              default=None,
-              help="The path to the user defined file containing the organisms to filter the reaction rules.",
-              )
-@click.option("--patterns_to_remove",
-              "patterns_to_remove",
-              type=str,
-              default='default',
-              show_default=True,
-              help="A user defined file containing SMARTS patterns. Products that match a pattern will be removed.",
-              )
-@click.option("--molecules_to_remove",
-              "molecules_to_remove",
-              type=str,
-              default='default',
-              show_default=True,
-              help="A user defined file containing molecules encoded as SMILES to be removed from the products.",
-              )
-@click.option("--min_atom_count",
-              "min_atom_count",
-              type=int,
-              default=5,
-              show_default=True,
-              help="The minimum atom count of a molecule (molecules with less atoms are removed from the products).",
-              )
-@click.option("--n_jobs",
-              "n_jobs",
-              type=int,
-              default=1,
-              show_default=True,
-              help="The number of jobs to run in parallel.",
-              )
+@add_options(BIOREACTOR_OPTIONS)
+@N_JOBS_OPTION
+@BATCH_SIZE_OPTION
+@VERBOSE_OPTION
 def bioreactor_cli(compounds,
                    output_path,
                    neutralize,
@@ -72,7 +30,9 @@ def bioreactor_cli(compounds,
                    patterns_to_remove,
                    molecules_to_remove,
                    min_atom_count,
-                   n_jobs):
+                   n_jobs,
+                   batch_size,
+                   verbose):
     """Run the BioCatalyzer.
 
     Mandatory arguments:
@@ -81,19 +41,20 @@ def bioreactor_cli(compounds,
 
         output_path: Path to the output directory.
     """
-    if reaction_rules is None:
-        reaction_rules = os.path.join(
-            DATA_FILES, '../data/reactionrules/reaction_rules_biocatalyzer.tsv.bz2')
+    setup_logging(output_path, verbose)
+    # imported here so that --help and argument errors do not pay for loading RDKit/pandas
+    from biocatalyzer.bioreactor import BioReactor
+
     br = BioReactor(compounds_path=compounds,
-                    output_path=output_path,
+                    output_path=str(output_path),
                     reaction_rules_path=reaction_rules,
                     neutralize_compounds=neutralize,
                     organisms_path=organisms,
                     patterns_to_remove_path=patterns_to_remove,
                     molecules_to_remove_path=molecules_to_remove,
                     min_atom_count=min_atom_count,
-                    n_jobs=n_jobs)
-    logging.basicConfig(filename=f'{output_path}_logging.log', level=logging.DEBUG)
+                    n_jobs=n_jobs,
+                    batch_size=batch_size)
     br.react()
 
 
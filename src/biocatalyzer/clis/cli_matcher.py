@@ -1,8 +1,8 @@
-import logging
+import pathlib
 
 import click
 
-from biocatalyzer import MSDataMatcher
+from biocatalyzer.clis._common import TOLERANCE_OPTION, N_JOBS_OPTION, VERBOSE_OPTION, setup_logging
 
 
 @click.command()
@@ -15,28 +15,18 @@ from biocatalyzer import MSDataMatcher
                 required=True,
                 )
 @click.argument("output_path",
-                type=click.Path(),
+                type=click.Path(file_okay=False, path_type=pathlib.Path, resolve_path=True),
                 required=True,
                 )
-@click.option("--tolerance",
-              "tolerance",
-              type=float,
-              default=0.02,
-              show_default=True,
-              help="The mass tolerance to use when matching MS data.",
-              )
-@click.option("--n_jobs",
-              "n_jobs",
-              type=int,
-              default=1,
-              show_default=True,
-              help="The number of jobs to run in parallel.",
-              )
+@TOLERANCE_OPTION
+@N_JOBS_OPTION
+@VERBOSE_OPTION
 def matcher_cli(ms_data,
                 compounds_to_match,
                 output_path,
                 tolerance,
-                n_jobs):
+                n_jobs,
+                verbose):
     """Run the MSDataMatcher.
 
     Mandatory arguments:
@@ -47,12 +37,15 @@ def matcher_cli(ms_data,
 
         output_path: Path to the output directory.
     """
+    setup_logging(output_path, verbose)
+    # imported here so that --help and argument errors do not pay for loading RDKit/pandas
+    from biocatalyzer.matcher import MSDataMatcher
+
     ms = MSDataMatcher(ms_data_path=ms_data,
                        compounds_to_match_path=compounds_to_match,
-                       output_path=output_path,
+                       output_path=str(output_path),
                        tolerance=tolerance,
                        n_jobs=n_jobs)
-    logging.basicConfig(filename=f'{output_path}_logging.log', level=logging.DEBUG)
     ms.generate_ms_results()
 
 
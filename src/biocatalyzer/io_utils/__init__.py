@@ -1 +1,2 @@
 from .loaders import Loaders
+from .writers import Writers
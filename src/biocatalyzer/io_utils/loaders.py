@@ -1,11 +1,89 @@
+import hashlib
 import logging
 import os
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
+from rdkit import Chem
 from rdkit.Chem import MolFromSmarts, MolFromSmiles
 
 from biocatalyzer.chem import ChemUtils
 
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:  # pyarrow is optional, pandas is used to read the files when it is not installed
+    pa = None
+    pacsv = None
+
+# declared column types (the remaining columns are inferred), so the readers can skip type inference
+_COMPOUNDS_DTYPE = {'compound_id': str, 'smiles': str}
+_RULES_DTYPE = {'InternalID': str, 'Reactants': str, 'SMARTS': str, 'EC_Numbers': str, 'Organisms': str}
+_ORGANISMS_DTYPE = {'org_id': str}
+_BYPRODUCTS_DTYPE = {'smiles': str}
+_PATTERNS_DTYPE = {'smarts': str}
+_MS_DTYPE = {'ParentCompound': str, 'ParentCompoundSmiles': str, 'Mass': float}
+# reaction rules columns with few distinct values (repeated over many rules), kept as categoricals
+_RULES_CATEGORICAL_COLUMNS = ('Reactants', 'EC_Numbers', 'Organisms')
+_NEW_COMPOUNDS_DTYPE = {'OriginalCompoundID': str, 'OriginalCompoundSmiles': str, 'OriginalReactionRuleID': str,
+                        'NewCompoundID': str, 'NewCompoundSmiles': str, 'NewReactionSmiles': str, 'EC_Numbers': str}
+
+# columns each input file must contain
+_REQUIRED_COMPOUNDS_COLUMNS = ('compound_id', 'smiles')
+_REQUIRED_RULES_COLUMNS = ('InternalID', 'Reactants', 'SMARTS', 'EC_Numbers', 'Organisms')
+_REQUIRED_MS_COLUMNS = ('ParentCompound', 'ParentCompoundSmiles', 'Mass')
+_REQUIRED_NEW_COMPOUNDS_COLUMNS = ('OriginalCompoundID', 'OriginalCompoundSmiles', 'OriginalReactionRuleID',
+                                   'NewCompoundID', 'NewCompoundSmiles', 'NewReactionSmiles', 'EC_Numbers')
+
+# same missing value markers as pandas.read_csv, so both readers produce the same DataFrames
+_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+              'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null']
+
+
+@lru_cache(maxsize=2 ** 14)
+def _uncharge_smiles(smiles: str):
+    """
+    Cached version of `ChemUtils.uncharge_smiles`.
+
+    Parameters
+    ----------
+    smiles: str
+        The molecule smiles to uncharge.
+
+    Returns
+    -------
+    str
+        The uncharged molecule smiles.
+    """
+    return ChemUtils.uncharge_smiles(smiles)
+
+
+def _drop_duplicate_compounds(compounds: pd.DataFrame):
+    """
+    Drop the compounds with the same SMILES string as a previous compound.
+    The reactor assigns the products of repeated SMILES strings to the first compound anyway, so only the first one
+    is kept and the repeated reactions are not run. Different SMILES of the same molecule are kept.
+
+    Parameters
+    ----------
+    compounds: pd.DataFrame
+        The compounds (with a smiles column).
+
+    Returns
+    -------
+    pd.DataFrame:
+        The compounds without duplicates.
+    """
+    duplicated = compounds['smiles'].duplicated(keep='first')
+    if duplicated.any():
+        logging.warning(f'Ignoring {duplicated.sum()} compounds with repeated SMILES: '
+                        f'{", ".join(compounds.compound_id[duplicated].astype(str))}.')
+        compounds = compounds[~duplicated].reset_index(drop=True)
+    return compounds
+
 
 class Loaders:
     """
@@ -16,6 +94,7 @@ class Loaders:
     def load_compounds(path: str, neutralize: bool = False):
         """
         Load compounds to use.
+        Compounds with the same SMILES string as a previous compound are dropped.
 
         Parameters
         ----------
@@ -30,21 +109,16 @@ class Loaders:
             pandas dataframe with the compounds to use.
         """
         if Loaders._verify_file(path):
-            compounds = pd.read_csv(path, header=0, sep='\t')
-            if 'smiles' not in compounds.columns:
-                raise ValueError('The compounds file must contain a column named "smiles".')
-            if 'compound_id' not in compounds.columns:
-                raise ValueError('The compounds file must contain a column named "compound_id".')
-            return compounds[['compound_id', 'smiles']]
-        elif ChemUtils.validate_smiles(path.split(';')):
-            df = pd.DataFrame()
-            df['smiles'] = path.split(';')
+            compounds = Loaders._read_tsv(path, dtype=_COMPOUNDS_DTYPE)
+            Loaders._check_columns(compounds, _REQUIRED_COMPOUNDS_COLUMNS, 'compounds')
+            return _drop_duplicate_compounds(compounds[list(_REQUIRED_COMPOUNDS_COLUMNS)])
+        smiles = path.split(';')
+        if ChemUtils.validate_smiles(smiles):
             if neutralize:
-                df['smiles'] = [ChemUtils.uncharge_smiles(s) for s in df.smiles.values]
-            df['compound_id'] = [f'input_compound_{i}' for i in range(len(df))]
-            return df
-        else:
-            raise FileNotFoundError(f"File {path} not found.")
+                smiles = [_uncharge_smiles(s) for s in smiles]
+            df = pd.DataFrame({'smiles': smiles, 'compound_id': [f'input_compound_{i}' for i in range(len(smiles))]})
+            return _drop_duplicate_compounds(df)
+        raise FileNotFoundError(f"File {path} not found.")
 
     @staticmethod
     def load_reaction_rules(path, orgs='ALL'):
@@ -63,37 +137,138 @@ class Loaders:
         pd.DataFrame:
             pandas dataframe with the reaction rules to use.
         """
-        if not Loaders._verify_file(path):
+        try:
+            cache_key = Loaders._cache_key(path)
+        except FileNotFoundError:
             raise FileNotFoundError(f"File {path} not found.")
-        if path.endswith('.bz2'):
-            rules = pd.read_csv(path, header=0, sep='\t', compression='bz2')
-        else:
-            rules = pd.read_csv(path, header=0, sep='\t')
-        if 'InternalID' not in rules.columns:
-            raise ValueError('The reaction rules file must contain a column named "InternalID".')
-        if 'Reactants' not in rules.columns:
-            raise ValueError('The reaction rules file must contain a column named "Reactants".')
-        if 'SMARTS' not in rules.columns:
-            raise ValueError('The reaction rules file must contain a column named "SMARTS".')
-        if 'EC_Numbers' not in rules.columns:
-            raise ValueError('The reaction rules file must contain a column named "EC_Numbers".')
-        if 'Organisms' not in rules.columns:
-            raise ValueError('The reaction rules file must contain a column named "Organisms".')
-
-        def match_org(value, orgs_list):
-            if isinstance(value, str):
-                if any(s in value.split(';') for s in orgs_list):
-                    return True
-            return False
+        # the cached DataFrame is shared between calls and must not be modified
+        rules = Loaders._read_reaction_rules(*cache_key)
+        Loaders._check_columns(rules, _REQUIRED_RULES_COLUMNS, 'reaction rules')
 
         if not isinstance(orgs, str):
             # TODO: check if adding spontaneous reactions actually makes sense
-            orgs.append('spontaneous_reaction')
-            rules['has_org'] = rules.apply(lambda x: match_org(x['Organisms'], orgs), axis=1)
-            rules = rules[rules['has_org']]
-            rules.drop('has_org', axis=1, inplace=True)
+            orgs_list = [str(org) for org in orgs] + ['spontaneous_reaction']
+            # the Organisms fields are long ;-separated lists: searching for ';org;' in the padded string is much
+            # faster than splitting every field
+            keys = [f';{org};' for org in orgs_list]
+            # Organisms is categorical: each distinct value is only searched once and missing values (code -1,
+            # the extra False) are never looked at
+            organisms = rules['Organisms']
+            has_org = np.array([any(key in f';{value};' for key in keys)
+                                for value in organisms.cat.categories] + [False])
+            has_org = has_org[organisms.cat.codes.values]
+            # taking the rows already builds a new DataFrame (not a view of the cached one)
+            return rules.take(np.flatnonzero(has_org))
+        return rules.copy()
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _read_reaction_rules(path: str, mtime_ns: int):
+        """
+        Read a reaction rules file.
+        Results are cached by path and modification time, so the (large) default rules file is only parsed once
+        per process unless it changes.
+
+        Parameters
+        ----------
+        path: str
+            Path to the reaction rules.
+        mtime_ns: int
+            The modification time of the file (part of the cache key).
+
+        Returns
+        -------
+        pd.DataFrame:
+            pandas dataframe with all the reaction rules in the file.
+        """
+        if pa is None:
+            return Loaders._rules_to_categorical(Loaders._read_tsv(path, dtype=_RULES_DTYPE))
+        # with pyarrow, a parquet copy of the rules is kept next to the file (or in BIOCATALYZER_CACHE_DIR) so that
+        # other processes can skip parsing (and decompressing) the TSV
+        cache_path = Loaders._parquet_cache_path(path)
+        try:
+            cache_mtime_ns = os.stat(cache_path).st_mtime_ns
+        except OSError:
+            cache_mtime_ns = None
+        if cache_mtime_ns is not None and cache_mtime_ns >= mtime_ns:
+            try:
+                # parquet copies written by older versions may not have the categorical columns
+                return Loaders._rules_to_categorical(pd.read_parquet(cache_path, engine='pyarrow'))
+            except (OSError, pa.ArrowException):
+                logging.warning(f'Could not read {cache_path}, reading {path} instead.')
+        rules = Loaders._rules_to_categorical(Loaders._read_tsv(path, dtype=_RULES_DTYPE))
+        # only reaction rules files get a parquet copy
+        Loaders._check_columns(rules, _REQUIRED_RULES_COLUMNS, 'reaction rules')
+        Loaders._write_parquet(rules, cache_path)
+        return rules
+
+    @staticmethod
+    def _parquet_cache_path(path: str):
+        """
+        Get the path to the parquet copy of a file.
+        The copy is written next to the file, or to the BIOCATALYZER_CACHE_DIR directory when the environment
+        variable is set (named after a hash of the file path, so different files never share a copy).
+
+        Parameters
+        ----------
+        path: str
+            The (real) path to the file.
+
+        Returns
+        -------
+        str:
+            The path to the parquet copy.
+        """
+        cache_dir = os.environ.get('BIOCATALYZER_CACHE_DIR')
+        if not cache_dir:
+            return path + '.parquet'
+        digest = hashlib.sha256(path.encode()).hexdigest()
+        return os.path.join(cache_dir, f'{os.path.basename(path)}.{digest[:16]}.parquet')
+
+    @staticmethod
+    def _rules_to_categorical(rules: pd.DataFrame):
+        """
+        Convert the reaction rules columns with many repeated values to categoricals.
+        This saves memory and lets the organisms filter look at each distinct value only once.
+
+        Parameters
+        ----------
+        rules: pd.DataFrame
+            The reaction rules.
+
+        Returns
+        -------
+        pd.DataFrame:
+            The reaction rules with categorical columns.
+        """
+        for col in _RULES_CATEGORICAL_COLUMNS:
+            if col in rules.columns:
+                rules[col] = rules[col].astype('category')
         return rules
 
+    @staticmethod
+    def _write_parquet(df: pd.DataFrame, path: str):
+        """
+        Write a DataFrame to a parquet file, replacing it atomically.
+        Nothing is written if the directory is not writable (e.g. package data in a read-only install).
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            The DataFrame to write.
+        path: str
+            The path to the parquet file.
+        """
+        # unique per process and thread, so concurrent writers never share a temporary file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(tmp_path, engine='pyarrow', compression='zstd', index=False)
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     @staticmethod
     def load_organisms(path):
         """
@@ -102,7 +277,8 @@ class Loaders:
         Parameters
         ----------
         path: str
-            Path to the organisms or ;-separated list of organisms identifiers.
+            Path to the organisms or ;-separated list of organisms identifiers (paths to files must have an
+            extension or a directory, e.g. organisms.tsv or ./organisms).
 
         Returns
         -------
@@ -111,8 +287,12 @@ class Loaders:
         """
         if path is None or path == 'None':
             return 'ALL'
+        # identifiers can be told apart from paths without looking at the file system
+        if path.isidentifier() or (';' in path and '.' not in path and os.sep not in path):
+            logging.info(f'Using {path.split(";")} as the Organisms.')
+            return path.split(';')
         if Loaders._verify_file(path):
-            orgs = pd.read_csv(path, header=0, sep='\t')
+            orgs = Loaders._read_tsv(path, dtype=_ORGANISMS_DTYPE)
             if 'org_id' not in orgs.columns:
                 raise ValueError('The organisms file must contain a column named "org_id".')
             logging.info(f'Using {list(orgs.org_id.values)} as the Organisms.')
@@ -140,10 +320,32 @@ class Loaders:
         """
         if path is None or path == 'None':
             return []
-        byproducts = pd.read_csv(path, header=0, sep='\t')
+        # new list with the cached (read-only) molecules
+        return list(Loaders._read_byproducts_to_remove(*Loaders._cache_key(path)))
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _read_byproducts_to_remove(path: str, mtime_ns: int):
+        """
+        Read the byproducts to remove and build their molecules.
+        Results are cached by path and modification time.
+
+        Parameters
+        ----------
+        path: str
+            Path to the byproducts to remove.
+        mtime_ns: int
+            The modification time of the file (part of the cache key).
+
+        Returns
+        -------
+        tuple:
+            The byproducts' molecules.
+        """
+        byproducts = Loaders._read_tsv(path, dtype=_BYPRODUCTS_DTYPE)
         if 'smiles' not in byproducts.columns:
             raise ValueError('The molecules to remove file must contain a column named "smiles".')
-        return [MolFromSmiles(sp) for sp in byproducts.smiles.values]
+        return Loaders._build_mols(byproducts.smiles, MolFromSmiles, 'molecules')
 
     @staticmethod
     def load_patterns_to_remove(path):
@@ -162,10 +364,140 @@ class Loaders:
         """
         if path is None or path == 'None':
             return []
-        patterns = pd.read_csv(path, header=0, sep='\t')
+        # new list with the cached (read-only) patterns
+        return list(Loaders._read_patterns_to_remove(*Loaders._cache_key(path)))
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _read_patterns_to_remove(path: str, mtime_ns: int):
+        """
+        Read the patterns to remove and build their query molecules.
+        Results are cached by path and modification time.
+
+        Parameters
+        ----------
+        path: str
+            Path to the patterns to remove.
+        mtime_ns: int
+            The modification time of the file (part of the cache key).
+
+        Returns
+        -------
+        tuple:
+            The patterns' query molecules.
+        """
+        patterns = Loaders._read_tsv(path, dtype=_PATTERNS_DTYPE)
         if 'smarts' not in patterns.columns:
             raise ValueError('The patterns to remove file must contain a column named "smarts".')
-        return [MolFromSmarts(sp) for sp in patterns.smarts.values]
+        return Loaders._build_mols(patterns.smarts, MolFromSmarts, 'patterns')
+
+    @staticmethod
+    def _check_columns(df: pd.DataFrame, required: Tuple[str, ...], name: str):
+        """
+        Check that a DataFrame read from an input file contains the required columns.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            The DataFrame to check.
+        required: tuple
+            The required columns.
+        name: str
+            The name of the input file type (used in the error message).
+
+        Raises
+        ------
+        ValueError
+            If any of the required columns is missing.
+        """
+        columns = set(df.columns)
+        missing = [col for col in required if col not in columns]
+        if missing:
+            raise ValueError(f'The {name} file must contain the columns {list(required)} (missing: {missing}).')
+
+    @staticmethod
+    def _build_mols(values: pd.Series, parser: Callable[[str], Optional[Chem.Mol]], kind: str):
+        """
+        Build the molecules of unique SMILES/SMARTS, ignoring empty and invalid entries.
+
+        Parameters
+        ----------
+        values: pd.Series
+            The SMILES/SMARTS strings.
+        parser: Callable
+            The function building a molecule from a string (returns None if the string is invalid).
+        kind: str
+            What the molecules are (used in the log message).
+
+        Returns
+        -------
+        tuple:
+            The molecules, in the order of their first occurrence.
+        """
+        mols = []
+        invalid = []
+        for value in values.dropna().drop_duplicates().values:
+            mol = parser(value)
+            if mol is None:
+                invalid.append(value)
+            else:
+                mols.append(mol)
+        if invalid:
+            logging.warning(f'Ignoring {len(invalid)} invalid {kind} to remove: {invalid}')
+        return tuple(mols)
+
+    @staticmethod
+    def _cache_key(path: str):
+        """
+        Get the key used to cache the contents of a file: its real path and modification time.
+
+        Parameters
+        ----------
+        path: str
+            The path to the file.
+
+        Returns
+        -------
+        tuple:
+            The real path and the modification time (in nanoseconds) of the file.
+        """
+        return os.path.realpath(path), os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def _read_tsv(path: str, dtype: Optional[Dict[str, Any]] = None):
+        """
+        Read a tab separated file with a header (compressed files are decompressed based on their extension).
+        Uses the pyarrow CSV reader when pyarrow is installed and pandas otherwise.
+
+        Parameters
+        ----------
+        path: str
+            The path to the file.
+        dtype: dict
+            The types (str or float) of known columns. Missing columns are ignored and the others are inferred.
+
+        Returns
+        -------
+        pd.DataFrame:
+            pandas dataframe with the file contents.
+        """
+        if pacsv is None:
+            return pd.read_csv(path, header=0, sep='\t', dtype=dtype)
+        column_types = {col: pa.string() if t is str else pa.float64() for col, t in (dtype or {}).items()}
+        try:
+            table = pacsv.read_csv(path,
+                                   parse_options=pacsv.ParseOptions(delimiter='\t'),
+                                   convert_options=pacsv.ConvertOptions(column_types=column_types,
+                                                                        null_values=_NA_VALUES,
+                                                                        strings_can_be_null=True))
+        except pa.ArrowInvalid:
+            # pyarrow is stricter than pandas (e.g. rows missing trailing empty fields)
+            return pd.read_csv(path, header=0, sep='\t', dtype=dtype)
+        # columns without any value are read as float (NaN) by pandas
+        null_columns = [i for i, field in enumerate(table.schema) if pa.types.is_null(field.type)]
+        for i in null_columns:
+            table = table.set_column(i, table.schema.field(i).name, table.column(i).cast(pa.float64()))
+        return table.to_pandas()
 
     @staticmethod
     def _verify_file(path: str):
@@ -201,41 +533,41 @@ class Loaders:
         pd.DataFrame:
             pandas dataframe with the MS data.
         """
-        if Loaders._verify_file(path):
-            ms_data = pd.read_csv(path, header=0, sep='\t')
-            if 'ParentCompound' not in ms_data.columns:
-                raise ValueError('The MS data file must contain a column named "ParentCompound".')
-            if 'ParentCompoundSmiles' not in ms_data.columns:
-                raise ValueError('The MS data file must contain a column named "ParentCompoundSmiles".')
-            if 'Mass' not in ms_data.columns:
-                raise ValueError('The MS data file must contain a column named "Mass".')
-            return ms_data
-        else:
+        # opening the file directly instead of checking that it exists first saves a stat per call
+        try:
+            ms_data = Loaders._read_tsv(path, dtype=_MS_DTYPE)
+        except FileNotFoundError:
             raise FileNotFoundError(f"File {path} not found.")
+        Loaders._check_columns(ms_data, _REQUIRED_MS_COLUMNS, 'MS data')
+        return ms_data
 
     @staticmethod
-    def load_new_compounds(path: str):
+    def load_new_compounds(path: Union[str, pd.DataFrame]):
         """
         Load the new compounds data to match with the MS data.
         The file must be a new_compounds.tsv file resulting from running the BioCatalyzer BioReactor.
+        A DataFrame with the same columns (e.g. the output of `BioReactor.process_results`) can be used instead
+        of the path to avoid writing and parsing the file again.
 
         Parameters
         ----------
-        path: str
-            Path to the new compounds data.
+        path: Union[str, pd.DataFrame]
+            Path to the new compounds data or a DataFrame with the new compounds' data.
 
         Returns
         -------
         pd.DataFrame:
             pandas dataframe with the new compounds' data.
         """
-        if Loaders._verify_file(path):
-            new_compounds = pd.read_csv(path, header=0, sep='\t')
-            columns = ['OriginalCompoundID', 'OriginalCompoundSmiles', 'OriginalReactionRuleID', 'NewCompoundID',
-                       'NewCompoundSmiles', 'NewReactionSmiles', 'EC_Numbers']
-            if not all(col in new_compounds.columns for col in columns):
-                raise ValueError(f'The new compounds file must be a result of BioCatalyzer module, i.e. it should '
-                                 f'contain the following columns: {columns}.')
-            return new_compounds
+        if isinstance(path, pd.DataFrame):
+            new_compounds = path.copy()
         else:
-            raise FileNotFoundError(f"File {path} not found.")
+            try:
+                new_compounds = Loaders._read_tsv(path, dtype=_NEW_COMPOUNDS_DTYPE)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"File {path} not found.")
+        missing = set(_REQUIRED_NEW_COMPOUNDS_COLUMNS) - set(new_compounds.columns)
+        if missing:
+            raise ValueError(f'The new compounds file must be a result of BioCatalyzer module, i.e. it should '
+                             f'contain the following columns: {list(_REQUIRED_NEW_COMPOUNDS_COLUMNS)}.')
+        return new_compounds
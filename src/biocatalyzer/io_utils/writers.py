@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+except ImportError:  # pyarrow is optional, pandas is used to write the files when it is not installed
+    pa = None
+    pacsv = None
+
+
+class Writers:
+    """
+    Class containing a set of output utilities.
+    """
+
+    @staticmethod
+    def write_tsv(df: pd.DataFrame, path: str):
+        """
+        Write a DataFrame to a tab separated file with a header (without the index).
+        Uses the pyarrow CSV writer when pyarrow is installed and pandas otherwise.
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            The DataFrame to write.
+        path: str
+            The path to the file.
+        """
+        if pacsv is not None:
+            try:
+                table = pa.Table.from_pandas(Writers._format_floats(df), preserve_index=False)
+                with pa.OSFile(path, 'wb') as f:
+                    # pyarrow always quotes the header, so it is written as pandas would
+                    f.write(('\t'.join(map(str, df.columns)) + '\n').encode())
+                    write_options = pacsv.WriteOptions(include_header=False, delimiter='\t', quoting_style='none')
+                    pacsv.write_csv(table, f, write_options=write_options)
+                return
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                # values that need quoting (tabs, quotes, line breaks) or columns with mixed types
+                pass
+            except TypeError:
+                # quoting_style is only available from pyarrow 11.0.0
+                pass
+        df.to_csv(path, sep='\t', index=False)
+
+    @staticmethod
+    def _format_floats(df: pd.DataFrame):
+        """
+        Format the float columns as pandas writes them (pyarrow writes 1.0 as 1, which is read back as an integer).
+
+        Parameters
+        ----------
+        df: pd.DataFrame
+            The DataFrame to write.
+
+        Returns
+        -------
+        pd.DataFrame:
+            The DataFrame with the float columns as strings (missing values are kept missing).
+        """
+        float_columns = df.select_dtypes(include='float64').columns
+        if len(float_columns) == 0:
+            return df
+        formatted = {}
+        for column in float_columns:
+            values = df[column].to_numpy()
+            strings = values.astype(str).astype(object)
+            strings[np.isnan(values)] = None
+            formatted[column] = strings
+        return df.assign(**formatted)
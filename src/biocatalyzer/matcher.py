@@ -2,17 +2,46 @@ import logging
 import multiprocessing
 import os
 import time
-from typing import Union
+from typing import Any, Dict, Optional, Tuple, Union
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
-from pandarallel import pandarallel
 
 from biocatalyzer.chem import ChemUtils
-from biocatalyzer.io_utils import Loaders
-from biocatalyzer._utils import match_value
+from biocatalyzer.io_utils import Loaders, Writers
 
 DATA_FILES = os.path.dirname(__file__)
 
+# below this number of distinct SMILES, starting a process pool costs more than computing the masses serially
+_MIN_PARALLEL_SMILES = 1000
+
+
+def _exact_masses(smiles: pd.Series, n_jobs: int = 1):
+    """
+    Calculate the exact masses of molecules, computing the mass of each distinct SMILES only once.
+
+    Parameters
+    ----------
+    smiles: pd.Series
+        The molecules' SMILES.
+    n_jobs: int
+        The number of processes computing the masses.
+
+    Returns
+    -------
+    pd.Series:
+        The exact masses (NaN for invalid SMILES).
+    """
+    unique_smiles = smiles.unique()
+    if n_jobs > 1 and len(unique_smiles) >= _MIN_PARALLEL_SMILES:
+        with multiprocessing.Pool(n_jobs) as pool:
+            masses = pool.map(ChemUtils.calc_exact_mass, unique_smiles,
+                              chunksize=max(1, len(unique_smiles) // (4 * n_jobs)))
+    else:
+        masses = [ChemUtils.calc_exact_mass(s) for s in unique_smiles]
+    return smiles.map(dict(zip(unique_smiles, masses))).astype(float)
+
 
 class MSDataMatcher:
     """
@@ -23,7 +52,7 @@ class MSDataMatcher:
     def __init__(self,
                  ms_data_path: str,
                  output_path: str,
-                 compounds_to_match_path: str,
+                 compounds_to_match_path: Union[str, pd.DataFrame],
                  tolerance: float = 0.02,
                  n_jobs: int = 1):
         """
@@ -35,21 +64,24 @@ class MSDataMatcher:
             Path to the MS data.
         output_path: str
             Path to the output directory.
-        compounds_to_match_path: str
-            Path to the new predicted compounds to match.
+        compounds_to_match_path: Union[str, pd.DataFrame]
+            Path to the new predicted compounds to match or a DataFrame with them (e.g. the output of
+            `BioReactor.process_results`).
         tolerance: float
             The tolerance for the mass matching.
         n_jobs: int
-            The number of jobs to run in parallel.
+            The number of processes used to calculate the masses of the new compounds.
         """
+        # fail before loading the input files if previous results would be overwritten
+        self._output_path = output_path
+        self._set_output_path(self._output_path)
         self._set_up_data_files(compounds_to_match_path)
         if isinstance(self._new_compounds, pd.DataFrame):
             if self._new_compounds.shape[0] == 0:
                 raise ValueError('The new compounds file is empty!')
         self._ms_data_path = ms_data_path
         self._ms_data = Loaders.load_ms_data(self._ms_data_path)
-        self._output_path = output_path
-        self._set_output_path(self._output_path)
+        self._ms_mass_groups: Optional[Dict[Any, Tuple[npt.NDArray[np.intp], npt.NDArray[np.float64]]]] = None
         self._tolerance = tolerance
         if n_jobs == -1:
             self._n_jobs = multiprocessing.cpu_count()
@@ -111,6 +143,7 @@ class MSDataMatcher:
             self._ms_data_path = path
             logging.info('Loading MS data with the new path information...')
             self._ms_data = Loaders.load_ms_data(self._ms_data_path)
+            self._ms_mass_groups = None
         if self._matches is not None:
             logging.warning('Results should be generated again for the new information provided!')
 
@@ -192,14 +225,14 @@ class MSDataMatcher:
         """
         raise AttributeError('Matches cannot be set manually! You need to run the generate_ms_results method!')
 
-    def _set_up_data_files(self, new_compounds: str):
+    def _set_up_data_files(self, new_compounds: Union[str, pd.DataFrame]):
         """
         Set up the reaction rules and new compounds data files.
 
         Parameters
         ----------
-        new_compounds: str
-            The path to the new compounds to match.
+        new_compounds: Union[str, pd.DataFrame]
+            The path to the new compounds to match or a DataFrame with them.
         """
         self._set_up_reaction_rules()
         self._set_up_new_compounds(new_compounds)
@@ -212,14 +245,14 @@ class MSDataMatcher:
             DATA_FILES, 'data/reactionrules/all_reaction_rules_forward_no_smarts_duplicates_sample.tsv')
         self._reaction_rules = Loaders.load_reaction_rules(self._reaction_rules_path)
 
-    def _set_up_new_compounds(self, path: str):
+    def _set_up_new_compounds(self, path: Union[str, pd.DataFrame]):
         """
         Loads the new compounds data file.
 
         Parameters
         ----------
-        path: str
-            Path to the new compounds' data.
+        path: Union[str, pd.DataFrame]
+            Path to the new compounds' data or a DataFrame with it.
         """
         self._new_compounds = Loaders.load_new_compounds(path)
 
@@ -233,41 +266,79 @@ class MSDataMatcher:
         output_path: str
             The path to the output directory.
         """
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
-        else:
-            if os.path.exists(output_path + '/matches.tsv'):
-                raise FileExistsError(f"File {output_path} already exists. Define a different output path so that "
-                                      f"previous results are not overwritten.")
+        if os.path.exists(os.path.join(output_path, 'matches.tsv')):
+            raise FileExistsError(f"File {output_path} already exists. Define a different output path so that "
+                                  f"previous results are not overwritten.")
+        os.makedirs(output_path, exist_ok=True)
 
     def _calculate_masses(self):
         """
         Calculate the masses of the new compounds.
         """
-        self._new_compounds['NewCompoundExactMass'] = \
-            [ChemUtils.calc_exact_mass(m) for m in self._new_compounds.NewCompoundSmiles.values]
-        self._new_compounds['NewCompoundExactMass'] = self._new_compounds['NewCompoundSmiles'].apply(
-            lambda x: ChemUtils.calc_exact_mass(x))
+        self._new_compounds['NewCompoundExactMass'] = _exact_masses(self._new_compounds['NewCompoundSmiles'],
+                                                                    self._n_jobs)
 
-    def _match_to_parent(self, value: float, parent: str):
+    def _get_ms_mass_groups(self):
         """
-        Match the mass value to the parent products.
-
-        Parameters
-        ----------
-        value: float
-            The value to match.
-        parent: str
-            The parent compound.
+        Group the MS data masses by parent compound, sorted by mass.
+        The groups are built once per MS data file and reused when matching again (e.g. with another tolerance).
 
         Returns
         -------
-        list:
-            The list of matched indexes.
+        dict:
+            The positions (in the MS data) and the masses of the entries of each parent compound, sorted by mass.
         """
-        ms_data = self._ms_data[self._ms_data['ParentCompound'] == parent]
-        matches = match_value(value, ms_data['Mass'].values, self._tolerance)
-        return ms_data.iloc[matches].index.values
+        if self._ms_mass_groups is None:
+            ms_masses = self._ms_data['Mass'].to_numpy(dtype=float)
+            self._ms_mass_groups = {}
+            for parent, positions in self._ms_data.groupby('ParentCompound', sort=False).indices.items():
+                positions = positions[np.argsort(ms_masses[positions], kind='stable')]
+                self._ms_mass_groups[parent] = (positions, ms_masses[positions])
+        return self._ms_mass_groups
+
+    def _match_indexes(self):
+        """
+        Find, for each new compound, the MS data entries of its parent compound with a mass within the tolerance.
+        The sorted masses of each parent compound (see `_get_ms_mass_groups`) are searched with binary search, so
+        all the new compounds are matched with a few array operations per parent.
+
+        Returns
+        -------
+        pd.Series:
+            The indexes of the matched MS data entries (in the MS data order) for each new compound.
+        """
+        new_masses = self._new_compounds['NewCompoundExactMass'].values.astype(float)
+        indexes = [np.array([], dtype=self._ms_data.index.dtype)] * len(new_masses)
+        # the parent compound id is the new compound id without the last '_' field
+        parents = pd.Series([new_id.rpartition('_')[0] for new_id in self._new_compounds['NewCompoundID'].values])
+        ms_groups = self._get_ms_mass_groups()
+        tol = self._tolerance
+        for parent, rows in parents.groupby(parents, sort=False).indices.items():
+            group = ms_groups.get(parent)
+            if group is None:
+                continue
+            positions, sorted_masses = group
+            targets = new_masses[rows]
+            # the search window is wider than the tolerance, the exact comparison below selects the matches
+            lo = np.searchsorted(sorted_masses, targets - 2 * tol, side='left')
+            hi = np.searchsorted(sorted_masses, targets + 2 * tol, side='right')
+            counts = hi - lo
+            # one (new compound, candidate) pair per candidate in each window
+            pair_rows = np.repeat(np.arange(len(rows)), counts)
+            pair_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            sorted_candidates = np.repeat(lo, counts) + pair_offsets
+            candidates = positions[sorted_candidates]
+            candidate_masses = sorted_masses[sorted_candidates]
+            is_match = (candidate_masses - tol <= targets[pair_rows]) & (targets[pair_rows] <= candidate_masses + tol)
+            pair_rows, candidates = pair_rows[is_match], candidates[is_match]
+            # keep the MS data order within each new compound
+            sorting = np.lexsort((candidates, pair_rows))
+            pair_rows, candidates = pair_rows[sorting], candidates[sorting]
+            matched = self._ms_data.index.values[candidates]
+            bounds = np.searchsorted(pair_rows, np.arange(len(rows) + 1))
+            for i, row in enumerate(rows):
+                indexes[row] = matched[bounds[i]:bounds[i + 1]]
+        return pd.Series(indexes, index=self._new_compounds.index, dtype=object)
 
     def _match_masses(self):
         """
@@ -278,19 +349,26 @@ class MSDataMatcher:
         pd.DataFrame:
             pandas dataframe with the matches.
         """
-        ms_df = self._new_compounds
-        pandarallel.initialize(nb_workers=self._n_jobs)
-        ms_df['Index'] = self._new_compounds.parallel_apply(
-            lambda x: self._match_to_parent(x['NewCompoundExactMass'],
-                                            '_'.join(x['NewCompoundID'].split('_')[:-1])), axis=1)
-
-        ms_df = self._new_compounds[self._new_compounds['Index'].map(lambda d: len(d)) > 0]
-        ms_df = ms_df.explode('Index')
-        ms_df.drop(columns=['OriginalReactionRuleID', 'NewReactionSmiles'], inplace=True)
-        ms_df['ParentCompoundExactMass'] = [ChemUtils.calc_exact_mass(m) for m in ms_df.OriginalCompoundSmiles.values]
-        ms_df['MassDiff'] = ms_df['ParentCompoundExactMass'] - ms_df['NewCompoundExactMass']
-        ms_df = ms_df[['Index', 'OriginalCompoundID', 'OriginalCompoundSmiles', "ParentCompoundExactMass",
-                       'NewCompoundID', 'NewCompoundSmiles', 'NewCompoundExactMass', 'MassDiff', 'EC_Numbers']]
+        indexes = self._match_indexes()
+        self._new_compounds['Index'] = indexes
+        # one row per (new compound, matched MS entry) pair, built column by column from the matched rows only
+        counts = np.fromiter(map(len, indexes), dtype=np.int64, count=len(indexes))
+        rows = np.repeat(np.arange(len(indexes)), counts)
+        new_compounds = self._new_compounds
+        parent_smiles = pd.Series(new_compounds['OriginalCompoundSmiles'].values[rows], dtype=object)
+        parent_masses = _exact_masses(parent_smiles).values
+        new_masses = new_compounds['NewCompoundExactMass'].values[rows]
+        ms_df = pd.DataFrame({
+            'Index': np.concatenate(list(indexes)) if len(indexes) > 0 else np.array([], dtype=np.int64),
+            'OriginalCompoundID': new_compounds['OriginalCompoundID'].values[rows],
+            'OriginalCompoundSmiles': parent_smiles.values,
+            'ParentCompoundExactMass': parent_masses,
+            'NewCompoundID': new_compounds['NewCompoundID'].values[rows],
+            'NewCompoundSmiles': new_compounds['NewCompoundSmiles'].values[rows],
+            'NewCompoundExactMass': new_masses,
+            'MassDiff': parent_masses - new_masses,
+            'EC_Numbers': new_compounds['EC_Numbers'].values[rows],
+        }, index=new_compounds.index[rows])
         return ms_df
 
     def generate_ms_results(self):
@@ -304,7 +382,7 @@ class MSDataMatcher:
         """
         t0 = time.time()
         self._matches = self._match_masses()
-        self._matches.to_csv(self._output_path + '/matches.tsv', sep='\t', index=False)
+        Writers.write_tsv(self._matches, os.path.join(self._output_path, 'matches.tsv'))
         logging.info(f"Matches saved to {self._output_path}/matches.tsv")
         logging.info(f"{self._matches.shape[0]} matches found!")
         t1 = time.time()
@@ -318,5 +396,5 @@ if __name__ == '__main__':
                        output_path=output_path_,
                        tolerance=0.0015,
                        n_jobs=-1)
-    logging.basicConfig(filename=f'{output_path_}logging_matcher.log', level=logging.DEBUG)
+    logging.basicConfig(filename=os.path.join(output_path_, 'logging_matcher.log'), level=logging.DEBUG)
     ms.generate_ms_results()
@@ -1,3 +1,12 @@
+import atexit
 import os
+import shutil
+import tempfile
 
-TESTS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data')
+# absolute, so that the paths stay valid in tests that change the working directory
+TESTS_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# the parquet copies of the reaction rules are written to a temporary directory instead of the data directories
+if 'BIOCATALYZER_CACHE_DIR' not in os.environ:
+    os.environ['BIOCATALYZER_CACHE_DIR'] = tempfile.mkdtemp(prefix='biocatalyzer-cache-')
+    atexit.register(shutil.rmtree, os.environ['BIOCATALYZER_CACHE_DIR'], ignore_errors=True)
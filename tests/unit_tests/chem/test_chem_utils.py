@@ -1,10 +1,12 @@
 from unittest import TestCase
 
+import numpy as np
 from rdkit import RDLogger
-from rdkit.Chem import MolFromSmiles, MolToInchi, Mol
+from rdkit.Chem import MolFromSmiles, MolFromSmarts, MolToInchi, MolToSmiles, Mol
 from rdkit.Chem.rdChemReactions import ChemicalReaction, ReactionFromSmarts
 
 from biocatalyzer.chem import ChemUtils
+from biocatalyzer.chem.chem_utils import _get_uncharger
 from biocatalyzer.chem._utils import _correct_number_of_parenthesis
 
 
@@ -19,16 +21,30 @@ class TestChemUtils(TestCase):
         invalid_smiles = 'C(C1C(C(C(C(O1)O)O)O)O)O('
 
         def same_compound(smiles1, smiles2):
-            mol1 = MolFromSmiles(smiles1)
-            mol2 = MolFromSmiles(smiles2)
-            return MolToInchi(mol1) == MolToInchi(mol2)
+            return MolToSmiles(MolFromSmiles(smiles1)) == MolToSmiles(MolFromSmiles(smiles2))
 
         for i, m in enumerate(smiles):
             self.assertNotEqual(ChemUtils.smiles_to_isomerical_smiles(m), smiles[i])
             self.assertTrue(same_compound(m, ChemUtils.smiles_to_isomerical_smiles(m)))
+        # InChI is independent of RDKit's SMILES canonicalization
+        self.assertEqual(MolToInchi(MolFromSmiles(smiles[0])),
+                         MolToInchi(MolFromSmiles(ChemUtils.smiles_to_isomerical_smiles(smiles[0]))))
 
         self.assertIsNone(ChemUtils.smiles_to_isomerical_smiles(invalid_smiles))
 
+    def test_smiles_to_substructure_mol(self):
+        smiles = 'Nc1ncnc2c1ncn2[C@@H]1O[C@H](COP(=O)(O)OP(=O)(O)OP(=O)(O)O)[C@@H](O)[C@H]1O'
+        patterns = [MolFromSmarts('**1*(*)*(O*1COP(*)(=O)O)[R]'), MolFromSmarts('n1cnc2c1ncn2'),
+                    MolFromSmarts('S1[Fe]S[Fe]1'), MolFromSmarts('[C^3]'), MolFromSmarts('[C^2]'), MolFromSmarts('[N^2]')]
+        mol = ChemUtils.smiles_to_substructure_mol(smiles)
+        full_mol = MolFromSmiles(smiles)
+        for p in patterns:
+            self.assertEqual(mol.HasSubstructMatch(p), full_mol.HasSubstructMatch(p))
+        self.assertEqual(mol.GetNumHeavyAtoms(), ChemUtils.smiles_to_mol(smiles, sanitize=False).GetNumHeavyAtoms())
+
+        invalid_smiles = 'C(C1C(C(C(C(O1)O)O)O)O)O('
+        self.assertIsNone(ChemUtils.smiles_to_substructure_mol(invalid_smiles))
+
     def test_validate_smiles(self):
         smiles = ['CN1C=NC2=C1C(=O)N(C(=O)N2C)C',
                   'C(C1C(C(C(C(O1)O)O)O)O)O',
@@ -54,11 +70,8 @@ class TestChemUtils(TestCase):
                   '[H]c1nc([H])c([H])c([H])c1[H]']
 
         def check_if_molecule_has_hydrogens(mol):
-            for atom in mol.GetAtoms():
-                atomic_num = atom.GetAtomicNum()
-                if atomic_num == 1:
-                    return True
-            return False
+            # explicit hydrogen atoms are the only atoms that are not heavy atoms
+            return mol.GetNumAtoms() > mol.GetNumHeavyAtoms()
 
         for s in smiles:
             self.assertFalse(check_if_molecule_has_hydrogens(ChemUtils._remove_hs(MolFromSmiles(s))))
@@ -106,6 +119,24 @@ class TestChemUtils(TestCase):
         invalid_smiles = 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C('
         self.assertEqual(len(ChemUtils.react(invalid_smiles, smarts[1])), 0)
 
+        # the reactants parsed in previous calls are reused and left unchanged by the reaction
+        hits = ChemUtils._reactant_mol.cache_info().hits
+        self.assertEqual(ChemUtils.react([known_reactant, coreactant], known_rule), reaction_smiles)
+        self.assertEqual(ChemUtils._reactant_mol.cache_info().hits, hits + 2)
+
+    def test_may_react(self):
+        known_reactant = 'Nc1nc(NC2CC2)c2ncn(C3C=CC(CO)C3)c2n1'
+        coreactant = 'O=C1C=CC=CC1=O'
+        known_rule = '[#6:10]-[#7H2,#16H1:9].[O:7]=[#6:3]-1-[#6;h1:4]=[#6:5]-[#6:6]=[#6:1]-[#6:2]-1=[O:8]>>[#6:10]-[*:9]-[#6:4]-1=[#6:5]-[#6:6]=[#6:1]-[#6:2](-[#8:8])=[#6:3]-1-[#8:7]'
+        self.assertTrue(ChemUtils._may_react([known_reactant, coreactant], known_rule))
+        # butane has no ring to match the quinone template
+        self.assertFalse(ChemUtils._may_react([known_reactant, 'CCCC'], known_rule))
+        self.assertEqual(len(ChemUtils.react([known_reactant, 'CCCC'], known_rule)), 0)
+        # invalid SMILES, invalid SMARTS and a wrong number of reactants are left to react
+        self.assertTrue(ChemUtils._may_react(['CN1C=NC2=C1C(=O)N(C(=O)N2C)C(', coreactant], known_rule))
+        self.assertTrue(ChemUtils._may_react([known_reactant], known_rule))
+        self.assertTrue(ChemUtils._may_react([known_reactant], 'invalid_smarts'))
+
     def test_create_reaction_instances(self):
         rule_smarts = '[#7:1].[#8:2].[#8:3]=[#6:4]1-[#6:5]=[#6:6]-[#6:7](=[#8:8])-[#6:9]=[#6:10]-1>>[#7+:1]-[#8:2].[#8:3]-[#6:4]1:[#6:10]:[#6:9]:[#6:7](-[#8:8]):[#6:6]:[#6:5]:1'
         rxn = ChemUtils._smarts_to_reaction(rule_smarts)
@@ -128,6 +159,9 @@ class TestChemUtils(TestCase):
         invalid_smiles = '[NH3+]CC[O-]]'
         self.assertEqual(ChemUtils.uncharge_smiles(invalid_smiles), '[NH3+]CC[O-]]')
 
+        # the Uncharger is created once and reused
+        self.assertIs(_get_uncharger(), _get_uncharger())
+
     def test_calc_exact_mass(self):
         smiles = ['[NH3+]CC[O-]', 'CC(=O)O[IH2+2](O)OC(C)=O', '[NH3+]CC([O-])C[O-]', 'NCCO']
         for s in smiles:
@@ -148,6 +182,8 @@ class TestChemUtils(TestCase):
         masses = [263.9684]
         self.assertTrue(ChemUtils.match_masses(smiles[0], masses, mass_tolerance=0.02)[0])
         self.assertFalse(ChemUtils.match_masses(smiles[0], masses, mass_tolerance=0.01)[0])
+        self.assertTrue(ChemUtils.match_masses(smiles[0], np.array([np.nan, 263.9684]), mass_tolerance=0.02)[0])
+        self.assertFalse(ChemUtils.match_masses(smiles[0], [], mass_tolerance=0.02)[0])
 
         self.assertTrue(ChemUtils.match_masses(smiles[0], None, mass_tolerance=0.01)[0])
 
@@ -1,71 +1,113 @@
 import os
-import platform
-import shutil
-from unittest import TestCase
+from unittest import TestCase, skipUnless
+
+import pytest
+from click.testing import CliRunner
+
+from biocatalyzer.clis.cli import biocatalyzer_cli
 
 from tests import TESTS_DATA_PATH
 
 
 class BioCatalyzerCLITestCase(TestCase):
 
+    runner: CliRunner
+    output_folder: str
+    new_output_folder: str
+    compounds_path: str
+    output_path: str
+    neutralize: bool
+    reaction_rules_path: str
+    patterns_to_remove_path: str
+    molecules_to_remove_path: str
+    min_atom_count: int
+    n_jobs: int
+    ms_data_path: str
+    match_ms_data: bool
+    tolerance: float
+
+    @classmethod
+    def setUpClass(cls):
+        cls.runner = CliRunner()
+        cls.output_folder = 'results/'
+        cls.new_output_folder = 'new_output_path/'
+        cls.compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
+        cls.output_path = cls.output_folder
+        cls.neutralize = False
+        cls.reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
+        cls.patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
+        cls.molecules_to_remove_path = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
+        cls.min_atom_count = 4
+        cls.n_jobs = -1
+        cls.ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
+        cls.match_ms_data = True
+        cls.tolerance = 0.02
+
     def setUp(self):
-        self.output_folder = 'results/'
-        self.new_output_folder = 'new_output_path/'
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
-        self.compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        self.output_path = self.output_folder
-        self.neutralize = False
-        self.reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        self.patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
-        self.molecules_to_remove_path = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
-        self.min_atom_count = 4
-        self.n_jobs = -1
-        self.ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
-        self.match_ms_data = True
-        self.tolerance = 0.02
-
-    def tearDown(self):
-        if os.path.exists(self.output_folder):
-            shutil.rmtree(self.output_folder)
+        # each test runs in a new temporary directory, so the relative output folders are never shared
+        filesystem = self.runner.isolated_filesystem()
+        filesystem.__enter__()
+        self.addCleanup(filesystem.__exit__, None, None, None)
+        os.makedirs(self.output_folder)
 
 
 class TestBioCatalyzerCLI(BioCatalyzerCLITestCase, TestCase):
 
     def test_biocatalyzer_cli(self):
+        result = self.runner.invoke(biocatalyzer_cli, '--help')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('--match_ms_data', result.output)
+
+    @skipUnless(os.environ.get('INTEGRATION') == '1', 'set INTEGRATION=1 to run the installed console script')
+    def test_biocatalyzer_cli_entry_point(self):
         exit_status = os.system('biocatalyzer_cli --help')
         self.assertEqual(exit_status, 0)
 
     def test_biocatalyzer_cli_missing_args(self):
-        expected_exit_code = 512 if platform.system() != 'Windows' else 2
+        expected_exit_code = 2
         # missing argument 'COMPOUNDS'
-        exit_status = os.system('biocatalyzer_cli')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(biocatalyzer_cli, '')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
         # missing argument 'OUTPUT_PATH'
-        exit_status = os.system('biocatalyzer_cli dummy_arg_1')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(biocatalyzer_cli, 'dummy_arg_1')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
+    def test_biocatalyzer_cli_missing_ms_data_path(self):
+        expected_exit_code = 2
+        # --match_ms_data without --ms_data_path (usage error raised before any work is done)
+        result = self.runner.invoke(biocatalyzer_cli, f"{self.compounds_path} {self.output_folder} --match_ms_data=True")
+        self.assertEqual(result.exit_code, expected_exit_code)
+
+    def test_biocatalyzer_cli_no_products(self):
+        # no product passes the min_atom_count filter, so the MS matching step is skipped
+        result = self.runner.invoke(biocatalyzer_cli, f"{self.compounds_path} {self.output_folder} "
+                                f"--reaction_rules={self.reaction_rules_path} --min_atom_count=1000 "
+                                f"--match_ms_data=True --ms_data_path={self.ms_data_path}")
+        self.assertEqual(result.exit_code, 0)
+        self.assertFalse(os.path.exists(os.path.join(self.output_folder, 'matches.tsv')))
+
+    @pytest.mark.slow
     def test_biocatalyzer_cli_working(self):
-        exit_status = os.system(f"biocatalyzer_cli {self.compounds_path} {self.output_folder}")
-        self.assertEqual(exit_status, 0)
+        result = self.runner.invoke(biocatalyzer_cli, f"{self.compounds_path} {self.output_folder}")
+        self.assertEqual(result.exit_code, 0)
 
     def test_biocatalyzer_full(self):
-        exit_status = os.system(f"biocatalyzer_cli {self.compounds_path} {self.output_folder} "
+        result = self.runner.invoke(biocatalyzer_cli, f"{self.compounds_path} {self.output_folder} "
                                 f"--neutralize={self.neutralize} --reaction_rules={self.reaction_rules_path} "
                                 f"--patterns_to_remove={self.patterns_to_remove_path} "
                                 f"--molecules_to_remove={self.molecules_to_remove_path} "
                                 f"--min_atom_count={self.min_atom_count} --match_ms_data={self.match_ms_data} "
                                 f"--ms_data_path={self.ms_data_path} --tolerance={self.tolerance} "
                                 f"--n_jobs={self.n_jobs}")
-        self.assertEqual(exit_status, 0)
+        self.assertEqual(result.exit_code, 0)
 
     def test_biocatalyzer_full2(self):
-        exit_status = os.system(f"biocatalyzer_cli {self.compounds_path} {self.output_folder} "
+        result = self.runner.invoke(biocatalyzer_cli, f"{self.compounds_path} {self.output_folder} "
                                 f"--neutralize={self.neutralize} --reaction_rules={self.reaction_rules_path} "
                                 f"--patterns_to_remove={None} "
                                 f"--molecules_to_remove={None} "
                                 f"--min_atom_count={self.min_atom_count} --match_ms_data={self.match_ms_data} "
                                 f"--ms_data_path={self.ms_data_path} --tolerance={self.tolerance} "
                                 f"--n_jobs={self.n_jobs}")
-        self.assertEqual(exit_status, 0)
+        self.assertEqual(result.exit_code, 0)
@@ -1,63 +1,81 @@
 import os
-import shutil
-import platform
-from unittest import TestCase
+from unittest import TestCase, skipUnless
+
+from click.testing import CliRunner
+
+from biocatalyzer.clis.cli_matcher import matcher_cli
 
 from tests import TESTS_DATA_PATH
 
 
 class MatchMSDataCLITestCase(TestCase):
 
-    def setUp(self):
-        self.output_folder = 'results/'
-        self.output_path = self.output_folder
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
-        self.ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
-        self.compounds_to_match_path = os.path.join(TESTS_DATA_PATH, 'results_sample/new_compounds.tsv')
-        self.tolerance = 0.02
+    runner: CliRunner
+    output_folder: str
+    output_path: str
+    ms_data_path: str
+    compounds_to_match_path: str
+    tolerance: float
 
-    def tearDown(self):
-        if os.path.exists(self.output_folder):
-            shutil.rmtree(self.output_folder)
+    @classmethod
+    def setUpClass(cls):
+        cls.runner = CliRunner()
+        cls.output_folder = 'results/'
+        cls.output_path = cls.output_folder
+        cls.ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
+        cls.compounds_to_match_path = os.path.join(TESTS_DATA_PATH, 'results_sample/new_compounds.tsv')
+        cls.tolerance = 0.02
+
+    def setUp(self):
+        # each test runs in a new temporary directory, so the relative output folders are never shared
+        filesystem = self.runner.isolated_filesystem()
+        filesystem.__enter__()
+        self.addCleanup(filesystem.__exit__, None, None, None)
+        os.makedirs(self.output_folder)
 
 
 class TestMatcherCLI(MatchMSDataCLITestCase, TestCase):
 
     def test_matcher_cli(self):
+        result = self.runner.invoke(matcher_cli, '--help')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('--tolerance', result.output)
+
+    @skipUnless(os.environ.get('INTEGRATION') == '1', 'set INTEGRATION=1 to run the installed console script')
+    def test_matcher_cli_entry_point(self):
         exit_status = os.system('matcher_cli --help')
         self.assertEqual(exit_status, 0)
 
     def test_matcher_cli_missing_all_args(self):
-        expected_exit_code = 512 if platform.system() != 'Windows' else 2
+        expected_exit_code = 2
         # missing argument 'MS_DATA'
-        exit_status = os.system('matcher_cli')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(matcher_cli, '')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
     def test_matcher_cli_invalid_ms_data_path(self):
-        expected_exit_code = 256 if platform.system() != 'Windows' else 1
+        expected_exit_code = 1
         # missing argument 'OUTPUT_PATH'
-        exit_status = os.system('matcher_cli dummy_arg_1 dummy_arg_2 dummy_arg_3')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(matcher_cli, 'dummy_arg_1 dummy_arg_2 dummy_arg_3')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
     def test_matcher_cli_missing_compounds_arg(self):
-        expected_exit_code = 512 if platform.system() != 'Windows' else 2
+        expected_exit_code = 2
         # dummy argumets (FileNotFoundError)
-        exit_status = os.system(f'matcher_cli {self.ms_data_path}')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(matcher_cli, f'{self.ms_data_path}')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
     def test_matcher_cli_missing_output_path_arg(self):
-        expected_exit_code = 512 if platform.system() != 'Windows' else 2
+        expected_exit_code = 2
         # dummy argumets (FileNotFoundError)
-        exit_status = os.system(f'matcher_cli {self.ms_data_path} {self.compounds_to_match_path}')
-        self.assertEqual(exit_status, expected_exit_code)
+        result = self.runner.invoke(matcher_cli, f'{self.ms_data_path} {self.compounds_to_match_path}')
+        self.assertEqual(result.exit_code, expected_exit_code)
 
     def test_matcher_cli_working(self):
-        exit_status = os.system(f"matcher_cli {self.ms_data_path} {self.compounds_to_match_path} {self.output_path}")
-        self.assertEqual(exit_status, 0)
+        result = self.runner.invoke(matcher_cli, f"{self.ms_data_path} {self.compounds_to_match_path} {self.output_path}")
+        self.assertEqual(result.exit_code, 0)
 
     def test_matcher_invalid_tolerance(self):
-        expected_exit_code = 512 if platform.system() != 'Windows' else 2
-        exit_status = os.system(f"matcher_cli {self.ms_data_path} {self.compounds_to_match_path} {self.output_path} "
+        expected_exit_code = 2
+        result = self.runner.invoke(matcher_cli, f"{self.ms_data_path} {self.compounds_to_match_path} {self.output_path} "
                                 f"--tolerance=invalid_tolerance")
-        self.assertEqual(exit_status, expected_exit_code)
+        self.assertEqual(result.exit_code, expected_exit_code)
@@ -1,87 +1,153 @@
 import os
-from unittest import TestCase
+import shutil
+import tempfile
+from typing import Any, Callable, List, Tuple
+from unittest import TestCase, mock
+
+import pandas as pd
 
 from biocatalyzer.io_utils import Loaders
+from biocatalyzer.io_utils import loaders
 
 from tests import TESTS_DATA_PATH
 
+BYPRODUCTS_PATH = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
+COMPOUNDS_PATH = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
+MS_DATA_PATH = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
+MS_DATA_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data_subsample.tsv')
+NEW_COMPOUNDS_PATH = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds.tsv')
+ORGANISMS_PATH = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_to_use.tsv')
+PATTERNS_PATH = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
+REACTION_RULES_PATH = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
+
 
 class LoadersTestCase(TestCase):
 
     def test_load_compounds(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        cmps = Loaders.load_compounds(path=compounds_path)
+        cmps = Loaders.load_compounds(path=COMPOUNDS_PATH)
         self.assertEqual(cmps.shape, (4, 2))
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        self.assertRaises(ValueError, Loaders.load_compounds, reaction_rules_path)
 
-        invalid_path = 'asdasdas.tsv'
-        self.assertRaises(FileNotFoundError, Loaders.load_compounds, invalid_path)
+    def test_load_compounds_duplicates(self):
+        # the third SMILES repeats the first one, the second is the same molecule written differently
+        with self.assertLogs(level='WARNING') as logs:
+            cmps = Loaders.load_compounds(path='OCC;C(O)C;OCC;CCCO')
+        self.assertIn('input_compound_2', logs.output[0])
+        self.assertEqual(list(cmps.compound_id), ['input_compound_0', 'input_compound_1', 'input_compound_3'])
+        self.assertEqual(list(cmps.smiles), ['OCC', 'C(O)C', 'CCCO'])
 
     def test_load_reaction_rules(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        rules = Loaders.load_reaction_rules(path=reaction_rules_path)
+        rules = Loaders.load_reaction_rules(path=REACTION_RULES_PATH)
         self.assertEqual(rules.shape, (51, 7))
 
-        rules = Loaders.load_reaction_rules(path=reaction_rules_path, orgs=['eco'])
+        orgs = ['eco']
+        rules = Loaders.load_reaction_rules(path=REACTION_RULES_PATH, orgs=orgs)
         self.assertEqual(rules.shape, (7, 7))
+        # the organisms list passed by the caller is not modified
+        self.assertEqual(orgs, ['eco'])
+        self.assertIsInstance(rules.Organisms.dtype, pd.CategoricalDtype)
+
+    def test_load_reaction_rules_cached(self):
+        rules = Loaders.load_reaction_rules(path=REACTION_RULES_PATH)
+        hits = Loaders._read_reaction_rules.cache_info().hits
+        # changes to the returned DataFrame do not leak into the cache
+        rules.drop(rules.index, inplace=True)
+        rules = Loaders.load_reaction_rules(path=REACTION_RULES_PATH)
+        self.assertEqual(Loaders._read_reaction_rules.cache_info().hits, hits + 1)
+        self.assertEqual(rules.shape, (51, 7))
 
-        self.assertRaises(ValueError, Loaders.load_reaction_rules, compounds_path)
-
-        invalid_path = 'asdasdas.tsv'
-        self.assertRaises(FileNotFoundError, Loaders.load_reaction_rules, invalid_path)
+    def test_reaction_rules_parquet_cache(self):
+        if loaders.pa is None:
+            self.skipTest('pyarrow is not installed')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = shutil.copy(REACTION_RULES_PATH, tmp_dir)
+            rules = Loaders._read_reaction_rules.__wrapped__(*Loaders._cache_key(path))
+            self.assertTrue(os.path.exists(Loaders._parquet_cache_path(path)))
+            # the second read comes from the parquet file
+            rules_parquet = Loaders._read_reaction_rules.__wrapped__(*Loaders._cache_key(path))
+            self.assertTrue(rules.equals(rules_parquet))
+
+            # files that are not reaction rules files do not get a parquet copy
+            path = shutil.copy(COMPOUNDS_PATH, tmp_dir)
+            self.assertRaises(ValueError, Loaders._read_reaction_rules.__wrapped__, *Loaders._cache_key(path))
+            self.assertFalse(os.path.exists(Loaders._parquet_cache_path(path)))
+
+            # without BIOCATALYZER_CACHE_DIR the copy is kept next to the file
+            with mock.patch.dict(os.environ, {'BIOCATALYZER_CACHE_DIR': ''}):
+                self.assertEqual(Loaders._parquet_cache_path(path), path + '.parquet')
+
+    def test_load_to_remove_cached(self):
+        patterns = Loaders.load_patterns_to_remove(PATTERNS_PATH)
+        byproducts = Loaders.load_byproducts_to_remove(BYPRODUCTS_PATH)
+        # changes to the returned lists do not leak into the cache
+        patterns.clear()
+        byproducts.clear()
+        self.assertEqual(Loaders.load_patterns_to_remove(PATTERNS_PATH),
+                         list(Loaders._read_patterns_to_remove(*Loaders._cache_key(PATTERNS_PATH))))
+        self.assertGreater(len(Loaders.load_patterns_to_remove(PATTERNS_PATH)), 0)
+        self.assertGreater(len(Loaders.load_byproducts_to_remove(BYPRODUCTS_PATH)), 0)
 
     def test_load_organisms(self):
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        organisms_path = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_to_use.tsv')
-        orgs = Loaders.load_organisms(path=organisms_path)
+        orgs = Loaders.load_organisms(path=ORGANISMS_PATH)
         self.assertEqual(len(orgs), 2)
 
-        self.assertRaises(ValueError, Loaders.load_organisms, reaction_rules_path)
-
-        invalid_path = 'asdasdas.tsv'
-        self.assertRaises(FileNotFoundError, Loaders.load_organisms, invalid_path)
+        with mock.patch.object(Loaders, '_verify_file') as verify_file:
+            self.assertEqual(Loaders.load_organisms('hsa;eco'), ['hsa', 'eco'])
+            self.assertEqual(Loaders.load_organisms('hsa'), ['hsa'])
+            verify_file.assert_not_called()
 
     def test_load_byproducts_to_remove(self):
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        molecules_to_remove_path = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
-        byproducts = Loaders.load_byproducts_to_remove(path=molecules_to_remove_path)
+        byproducts = Loaders.load_byproducts_to_remove(path=BYPRODUCTS_PATH)
         self.assertEqual(len(byproducts), 9)
 
-        self.assertRaises(ValueError, Loaders.load_byproducts_to_remove, reaction_rules_path)
-
-        invalid_path = 'asdasdas.tsv'
-        self.assertRaises(FileNotFoundError, Loaders.load_byproducts_to_remove, invalid_path)
-
     def test_load_patterns_to_remove(self):
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
-        patterns = Loaders.load_patterns_to_remove(path=patterns_to_remove_path)
+        patterns = Loaders.load_patterns_to_remove(path=PATTERNS_PATH)
         self.assertEqual(len(patterns), 8)
 
-        self.assertRaises(ValueError, Loaders.load_patterns_to_remove, reaction_rules_path)
-
-        invalid_path = 'asdasdas.tsv'
-        self.assertRaises(FileNotFoundError, Loaders.load_patterns_to_remove, invalid_path)
+    def test_load_to_remove_invalid_entries(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            patterns_path = os.path.join(tmp_dir, 'patterns.tsv')
+            with open(patterns_path, 'w') as f:
+                f.write('smarts\n[CX3](=O)[OX2H1]\n[C(\n[CX3](=O)[OX2H1]\n')
+            byproducts_path = os.path.join(tmp_dir, 'byproducts.tsv')
+            with open(byproducts_path, 'w') as f:
+                f.write('smiles\nO\nC(C\nO\n')
+            # invalid and repeated entries are ignored
+            self.assertEqual(len(Loaders.load_patterns_to_remove(patterns_path)), 1)
+            self.assertEqual(len(Loaders.load_byproducts_to_remove(byproducts_path)), 1)
+
+    def test_loaders_wrong_file(self):
+        loaders_wrong_files: List[Tuple[Callable[[str], Any], str]] = [(Loaders.load_compounds, REACTION_RULES_PATH),
+                                                                       (Loaders.load_reaction_rules, COMPOUNDS_PATH),
+                                                                       (Loaders.load_organisms, REACTION_RULES_PATH),
+                                                                       (Loaders.load_byproducts_to_remove, REACTION_RULES_PATH),
+                                                                       (Loaders.load_patterns_to_remove, REACTION_RULES_PATH),
+                                                                       (Loaders.load_ms_data, REACTION_RULES_PATH),
+                                                                       (Loaders.load_new_compounds, REACTION_RULES_PATH)]
+        for loader, wrong_file in loaders_wrong_files:
+            with self.subTest(loader=loader.__name__):
+                self.assertRaises(ValueError, loader, wrong_file)
+                self.assertRaises(FileNotFoundError, loader, 'asdasdas.tsv')
 
     def test_verify_file(self):
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        self.assertTrue(Loaders._verify_file(reaction_rules_path))
+        self.assertTrue(Loaders._verify_file(REACTION_RULES_PATH))
         self.assertFalse(Loaders._verify_file('random_path.tsv'))
 
     def test_load_ms_data(self):
-        ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        self.assertRaises(FileNotFoundError, Loaders.load_ms_data, 'random_path.tsv')
-        self.assertRaises(ValueError, Loaders.load_ms_data, reaction_rules_path)
-        self.assertEqual(Loaders.load_ms_data(ms_data_path).shape, (438, 20))
+        self.assertEqual(Loaders.load_ms_data(MS_DATA_PATH).shape, (438, 20))
 
     def test_load_new_compounds(self):
-        new_compounds_path = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds.tsv')
-        reaction_rules_path = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules.tsv')
-        self.assertRaises(FileNotFoundError, Loaders.load_new_compounds, 'random_path.tsv')
-        self.assertRaises(ValueError, Loaders.load_new_compounds, reaction_rules_path)
-        self.assertEqual(Loaders.load_new_compounds(new_compounds_path).shape, (269, 7))
-
-
+        self.assertEqual(Loaders.load_new_compounds(NEW_COMPOUNDS_PATH).shape, (269, 7))
+
+        # DataFrames are accepted in place of a path
+        new_compounds = Loaders.load_new_compounds(NEW_COMPOUNDS_PATH)
+        self.assertEqual(Loaders.load_new_compounds(new_compounds).shape, (269, 7))
+        self.assertRaises(ValueError, Loaders.load_new_compounds, new_compounds.drop(columns=['EC_Numbers']))
+
+    def test_read_tsv(self):
+        for path in [MS_DATA_SUBSAMPLE_PATH, NEW_COMPOUNDS_PATH]:
+            df = Loaders._read_tsv(path)
+            # pandas is used when pyarrow is not installed, and both readers give the same result
+            with mock.patch.object(loaders, 'pacsv', None):
+                df_pandas = Loaders._read_tsv(path)
+            self.assertTrue(df.equals(df_pandas))
+            self.assertEqual(list(df.columns), list(df_pandas.columns))
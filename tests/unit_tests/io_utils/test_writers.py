@@ -0,0 +1,45 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from biocatalyzer.io_utils import Writers
+from biocatalyzer.io_utils import writers
+
+
+class WritersTestCase(TestCase):
+
+    def test_write_tsv(self):
+        df = pd.DataFrame({'Index': [1, 2, 3],
+                           'NewCompoundSmiles': ['CCO', 'C[NH+](C)C', 'OC(=O)C'],
+                           'NewCompoundExactMass': [46.0419, 60.0808, np.nan],
+                           'EC_Numbers': ['1.1.1.1;1.1.1.2', np.nan, '2.3.1.1']})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'matches.tsv')
+            Writers.write_tsv(df, path)
+            with open(path) as f:
+                self.assertEqual(f.readline(), 'Index\tNewCompoundSmiles\tNewCompoundExactMass\tEC_Numbers\n')
+            pd.testing.assert_frame_equal(pd.read_csv(path, sep='\t'), df)
+
+            # floats are formatted as pandas does (1.0 is not written as 1)
+            floats = pd.DataFrame({'MassDiff': [0.0, 1.0, 1e-05, np.nan], 'Smiles': ['C', 'CC', 'CCC', 'CCCC']})
+            Writers.write_tsv(floats, path)
+            with open(path) as f:
+                self.assertEqual(f.read(), floats.to_csv(sep='\t', index=False))
+
+            # values that must be quoted are written by pandas
+            quoted = df.assign(EC_Numbers=['a\tb', 'c"d', 'e'])
+            Writers.write_tsv(quoted, path)
+            pd.testing.assert_frame_equal(pd.read_csv(path, sep='\t'), quoted)
+
+            with mock.patch.object(writers, 'pacsv', None):
+                Writers.write_tsv(df, path)
+            pd.testing.assert_frame_equal(pd.read_csv(path, sep='\t'), df)
+
+            # pyarrow versions without quoting_style (older than 11.0.0) fall back to pandas
+            if writers.pacsv is not None:
+                with mock.patch.object(writers.pacsv, 'WriteOptions', side_effect=TypeError):
+                    Writers.write_tsv(df, path)
+                pd.testing.assert_frame_equal(pd.read_csv(path, sep='\t'), df)
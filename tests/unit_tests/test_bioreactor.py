@@ -1,38 +1,54 @@
 import os
 import shutil
+import tempfile
+from typing import List
 from unittest import TestCase
 
-from biocatalyzer.bioreactor import BioReactor
+import pandas as pd
+import pytest
+
+from biocatalyzer.bioreactor import BioReactor, DATA_FILES
+from biocatalyzer.io_utils import Loaders
 
 from tests import TESTS_DATA_PATH
 
+BYPRODUCTS_PATH = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
+BYPRODUCTS_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts_subsample.tsv')
+COMPOUNDS_PATH = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
+COMPOUNDS_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds_subsample.tsv')
+ORGANISMS_PATH = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_to_use.tsv')
+ORGANISMS_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_subsample.tsv')
+PATTERNS_PATH = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
+PATTERNS_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns_subsample.tsv')
+REACTION_RULES_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules_subsample.tsv')
+RESULTS_SAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'results_sample/')
+
+# more workers than cores only adds start-up and scheduling overhead for the small test inputs
+# (the cores are split between the pytest-xdist workers when the tests run in parallel)
+N_JOBS = max(1, min(os.cpu_count() or 1, 4) // int(os.environ.get('PYTEST_XDIST_WORKER_COUNT', 1)))
+
 
 class BioReactorTestCase(TestCase):
 
     def setUp(self):
-        self.output_folder = 'results/'
-        self.new_output_folder = 'new_output_path/'
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
-
-    def tearDown(self):
-        if os.path.exists(self.output_folder):
-            shutil.rmtree(self.output_folder)
+        # a new directory per test, so that tests running at the same time do not share their outputs
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.output_folder = os.path.join(tmp_dir.name, 'results/')
+        self.new_output_folder = os.path.join(tmp_dir.name, 'new_output_path/')
+        os.makedirs(self.output_folder)
 
 
 class TestBioReactor(BioReactorTestCase, TestCase):
 
+    @pytest.mark.slow
     def test_bioreactor(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        organisms_path = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_to_use.tsv')
-        patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
-        molecules_to_remove_path = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
-        br = BioReactor(compounds_path=compounds_path,
-                        organisms_path=organisms_path,
-                        patterns_to_remove_path=patterns_to_remove_path,
-                        molecules_to_remove_path=molecules_to_remove_path,
+        br = BioReactor(compounds_path=COMPOUNDS_PATH,
+                        organisms_path=ORGANISMS_PATH,
+                        patterns_to_remove_path=PATTERNS_PATH,
+                        molecules_to_remove_path=BYPRODUCTS_PATH,
                         output_path=self.output_folder,
-                        n_jobs=12)
+                        n_jobs=N_JOBS)
         br.react()
 
         self.assertEqual(br.reaction_rules.shape, (7102, 7))
@@ -40,16 +56,14 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         with self.assertRaises(ValueError):
             _ = br.new_compounds
 
+    @pytest.mark.slow
     def test_bioreactor_all_orgs(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns.tsv')
-        molecules_to_remove_path = os.path.join(TESTS_DATA_PATH, 'byproducts_to_remove_sample/byproducts.tsv')
-        br_no_orgs_filter = BioReactor(compounds_path=compounds_path,
-                                       patterns_to_remove_path=patterns_to_remove_path,
-                                       molecules_to_remove_path=molecules_to_remove_path,
+        br_no_orgs_filter = BioReactor(compounds_path=COMPOUNDS_PATH,
+                                       patterns_to_remove_path=PATTERNS_PATH,
+                                       molecules_to_remove_path=BYPRODUCTS_PATH,
                                        output_path=self.output_folder,
                                        neutralize_compounds=True,
-                                       n_jobs=12)
+                                       n_jobs=N_JOBS)
         br_no_orgs_filter.react()
 
         self.assertEqual(br_no_orgs_filter.reaction_rules.shape, (22949, 7))
@@ -60,11 +74,11 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         r = br_no_orgs_filter.process_results(False)
         self.assertEqual(r[0].shape, (3220, 7))
 
+    @pytest.mark.slow
     def test_bioreactor_all_orgs_keep_all(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
         patterns_to_remove_path = None
         molecules_to_remove_path = None
-        br_no_orgs_filter = BioReactor(compounds_path=compounds_path,
+        br_no_orgs_filter = BioReactor(compounds_path=COMPOUNDS_PATH,
                                        patterns_to_remove_path=patterns_to_remove_path,
                                        molecules_to_remove_path=molecules_to_remove_path,
                                        output_path=self.output_folder,
@@ -75,12 +89,10 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         self.assertEqual(br_no_orgs_filter.compounds.shape, (4, 2))
 
     def test_bioreactor_properties_and_setters(self):
-        compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds.tsv')
-        organisms_path = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_to_use.tsv')
-        br = BioReactor(compounds_path=compounds_path,
-                        organisms_path=organisms_path,
+        br = BioReactor(compounds_path=COMPOUNDS_PATH,
+                        organisms_path=ORGANISMS_PATH,
                         output_path=self.output_folder,
-                        n_jobs=12)
+                        n_jobs=N_JOBS)
 
         with self.assertRaises(ValueError):
             _ = br.new_compounds
@@ -94,29 +106,27 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         shutil.rmtree(self.new_output_folder)
 
         with self.assertRaises(FileExistsError):
-            br.output_path = os.path.join(TESTS_DATA_PATH, 'results_sample/')
-
-        br.react()
+            br.output_path = RESULTS_SAMPLE_PATH
 
         with self.assertRaises(FileNotFoundError):
             br.compounds = 'not_existing_path.tsv'
 
-        br.compounds = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds_subsample.tsv')
+        br.compounds = COMPOUNDS_SUBSAMPLE_PATH
 
         br.compounds = 'CN1C=NC2=C1C(=O)N(C(=O)N2C)C;C(C1C(C(C(C(O1)O)O)O)O)O'
 
         with self.assertRaises(FileNotFoundError):
             br.reaction_rules = 'not_existing_path.tsv'
 
-        br.reaction_rules = os.path.join(TESTS_DATA_PATH, 'reaction_rules_sample/reactionrules_subsample.tsv')
+        br.reaction_rules = REACTION_RULES_SUBSAMPLE_PATH
 
-        br.output_path = 'new_output_path'
+        br.output_path = self.new_output_folder
 
         _ = br.compounds_path
         with self.assertRaises(FileNotFoundError):
             br.compounds_path = 'not_existing_path.tsv'
 
-        br.compounds_path = os.path.join(TESTS_DATA_PATH, 'compounds_sample/compounds_subsample.tsv')
+        br.compounds_path = COMPOUNDS_SUBSAMPLE_PATH
 
         _ = br.neutralize
         br.neutralize = True
@@ -125,7 +135,7 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         with self.assertRaises(FileNotFoundError):
             br.organisms_path = 'not_existing_path.tsv'
 
-        br.organisms_path = os.path.join(TESTS_DATA_PATH, 'organisms_sample/organisms_subsample.tsv')
+        br.organisms_path = ORGANISMS_SUBSAMPLE_PATH
 
         br.organisms_path = 'hsa;eco'
 
@@ -133,14 +143,13 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         with self.assertRaises(FileNotFoundError):
             br.molecules_to_remove_path = 'not_existing_path.tsv'
 
-        br.molecules_to_remove_path = os.path.join(TESTS_DATA_PATH,
-                                                   'byproducts_to_remove_sample/byproducts_subsample.tsv')
+        br.molecules_to_remove_path = BYPRODUCTS_SUBSAMPLE_PATH
 
         _ = br.patterns_to_remove_path
         with self.assertRaises(FileNotFoundError):
             br.patterns_to_remove_path = 'not_existing_path.tsv'
 
-        br.patterns_to_remove_path = os.path.join(TESTS_DATA_PATH, 'patterns_to_remove_sample/patterns_subsample.tsv')
+        br.patterns_to_remove_path = PATTERNS_SUBSAMPLE_PATH
 
         mac = br.min_atom_count
         br.min_atom_count = mac + 1
@@ -148,3 +157,56 @@ class TestBioReactor(BioReactorTestCase, TestCase):
         _ = br.n_jobs
         br.n_jobs = -1
         br.n_jobs = 6
+
+        br.batch_size = 10
+        self.assertEqual(br.batch_size, 10)
+        with self.assertRaises(ValueError):
+            br.batch_size = -1
+        self.assertEqual(br.batch_size, 10)
+        with self.assertRaises(ValueError):
+            BioReactor(compounds_path=COMPOUNDS_PATH, output_path=self.new_output_folder, batch_size=-1)
+
+    @pytest.mark.slow
+    def test_bioreactor_setters_after_react(self):
+        br = BioReactor(compounds_path=COMPOUNDS_PATH,
+                        organisms_path=ORGANISMS_PATH,
+                        output_path=self.output_folder,
+                        n_jobs=N_JOBS)
+        br.react()
+
+        # changing the inputs after reacting warns that the results are outdated
+        with self.assertLogs(level='WARNING'):
+            br.compounds = COMPOUNDS_SUBSAMPLE_PATH
+        with self.assertLogs(level='WARNING'):
+            br.reaction_rules = REACTION_RULES_SUBSAMPLE_PATH
+        with self.assertLogs(level='WARNING'):
+            br.organisms_path = 'hsa;eco'
+
+    def test_bioreactor_react_order(self):
+        # a few of the default reaction rules with products for every sample compound
+        rules_ids = ['Rule_27', 'Rule_37', 'Rule_107', 'Rule_516', 'Rule_930', 'Rule_38850', 'Rule_38857', 'Rule_38862',
+                     'Rule_38886', 'Rule_39030', 'Rule_39074', 'Rule_39173', 'Rule_40069', 'Rule_40468']
+        rules = Loaders.load_reaction_rules(os.path.join(DATA_FILES, 'data/reactionrules/reaction_rules_biocatalyzer.tsv.bz2'))
+        rules_path = os.path.join(self.output_folder, 'reaction_rules.tsv')
+        rules[rules.InternalID.isin(rules_ids)].to_csv(rules_path, sep='\t', index=False)
+
+        results: List[pd.DataFrame] = []
+        for n_jobs in [1, 2]:
+            br = BioReactor(compounds_path=COMPOUNDS_PATH,
+                            reaction_rules_path=rules_path,
+                            patterns_to_remove_path=None,
+                            molecules_to_remove_path=None,
+                            output_path=os.path.join(self.output_folder, f'n_jobs_{n_jobs}/'),
+                            n_jobs=n_jobs,
+                            batch_size=1)
+            br.react()
+            # the rows follow the compounds order and, for each compound, the reaction rules order
+            new_compounds = br._new_compounds_df
+            assert new_compounds is not None
+            compounds_order = new_compounds.OriginalCompoundID.map({c: i for i, c in enumerate(br.compounds.compound_id)})
+            rules_order = new_compounds.OriginalReactionRuleID.map({r: i for i, r in enumerate(br.reaction_rules.InternalID)})
+            self.assertTrue(pd.MultiIndex.from_arrays([compounds_order, rules_order]).is_monotonic_increasing)
+            results.append(br.process_results(save=False)[0].drop(columns=['NewCompoundID']))
+        # the rows (and the merged fields) do not depend on the order in which the workers finish
+        pd.testing.assert_frame_equal(results[0], results[1])
+        self.assertTrue(results[0].OriginalReactionRuleID.str.contains(';').any())
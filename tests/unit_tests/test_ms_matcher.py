@@ -1,34 +1,38 @@
 import os
 import shutil
-from unittest import TestCase
+import tempfile
+from unittest import TestCase, mock
 
 import pandas as pd
 
+from biocatalyzer import matcher
 from biocatalyzer.matcher import MSDataMatcher
 
 from tests import TESTS_DATA_PATH
 
+MS_DATA_PATH = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
+MS_DATA_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data_subsample.tsv')
+NEW_COMPOUNDS_PATH = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds.tsv')
+NEW_COMPOUNDS_SUBSAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds_subsample.tsv')
+RESULTS_SAMPLE_PATH = os.path.join(TESTS_DATA_PATH, 'results_sample/')
+
 
 class MSDataMatcherTestCase(TestCase):
 
     def setUp(self):
-        self.output_folder = 'results/'
-        self.new_output_folder = 'new_output_path/'
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
-
-    def tearDown(self):
-        if os.path.exists(self.output_folder):
-            shutil.rmtree(self.output_folder)
+        # a new directory per test, so that tests running at the same time do not share their outputs
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.output_folder = os.path.join(tmp_dir.name, 'results/')
+        self.new_output_folder = os.path.join(tmp_dir.name, 'new_output_path/')
+        os.makedirs(self.output_folder)
 
 
 class TestMSDataMatcher(MSDataMatcherTestCase, TestCase):
 
     def test_ms_data_matcher(self):
-        ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
-        compounds_to_match = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds.tsv')
-        ms = MSDataMatcher(ms_data_path=ms_data_path,
-                           compounds_to_match_path=compounds_to_match,
+        ms = MSDataMatcher(ms_data_path=MS_DATA_PATH,
+                           compounds_to_match_path=NEW_COMPOUNDS_PATH,
                            output_path=self.output_folder,
                            tolerance=0.0015)
 
@@ -39,11 +43,50 @@ class TestMSDataMatcher(MSDataMatcherTestCase, TestCase):
         self.assertIsInstance(ms.matches, pd.DataFrame)
         self.assertEqual(ms.matches.shape, (4, 9))
 
+        # same matches as the original (per compound) implementation
+        expected = pd.DataFrame({'Index': [33, 88, 33, 44],
+                                 'NewCompoundID': ['ACEBUTOLOL_c7ea3c8e-813e-4b83-8f5e-a951020fa070', 'ALMOTRIPTAN_2',
+                                                   'ACEBUTOLOL_05a25e0b-e1ff-4c76-8226-a00507604d81',
+                                                   'ACECAINIDE_f869994c-25df-4b00-a32a-2f797834cf2b'],
+                                 'ParentCompoundExactMass': [335.1965, 336.1740, 335.1965, 277.1785],
+                                 'NewCompoundExactMass': [318.1932, 335.1657, 318.1938, 277.1785],
+                                 'MassDiff': [17.0033, 1.0083, 17.0027, 0.0]})
+        matches = ms.matches[expected.columns].reset_index(drop=True)
+        pd.testing.assert_frame_equal(matches, expected, check_dtype=False, atol=1e-4)
+
+    def test_ms_data_matcher_n_jobs(self):
+        ms = MSDataMatcher(ms_data_path=MS_DATA_PATH,
+                           compounds_to_match_path=NEW_COMPOUNDS_PATH,
+                           output_path=self.output_folder,
+                           tolerance=0.0015)
+        # use the process pool even for the few compounds of the sample
+        with mock.patch.object(matcher, '_MIN_PARALLEL_SMILES', 0):
+            ms_parallel = MSDataMatcher(ms_data_path=MS_DATA_PATH,
+                                        compounds_to_match_path=NEW_COMPOUNDS_PATH,
+                                        output_path=self.output_folder,
+                                        tolerance=0.0015,
+                                        n_jobs=2)
+        pd.testing.assert_series_equal(ms.compounds_to_match.NewCompoundExactMass,
+                                       ms_parallel.compounds_to_match.NewCompoundExactMass)
+
+    def test_ms_data_matcher_mass_groups(self):
+        ms = MSDataMatcher(ms_data_path=MS_DATA_PATH,
+                           compounds_to_match_path=NEW_COMPOUNDS_PATH,
+                           output_path=self.output_folder,
+                           tolerance=0.0015)
+
+        groups = ms._get_ms_mass_groups()
+        self.assertIs(ms._get_ms_mass_groups(), groups)
+        for positions, masses in groups.values():
+            self.assertTrue((masses[:-1] <= masses[1:]).all())
+            self.assertTrue((ms._ms_data['Mass'].values[positions] == masses).all())
+
+        ms.ms_data_path = MS_DATA_SUBSAMPLE_PATH
+        self.assertIsNot(ms._get_ms_mass_groups(), groups)
+
     def test_ms_data_matcher_properties_and_setters(self):
-        ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data.tsv')
-        compounds_to_match = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds.tsv')
-        ms = MSDataMatcher(ms_data_path=ms_data_path,
-                           compounds_to_match_path=compounds_to_match,
+        ms = MSDataMatcher(ms_data_path=MS_DATA_PATH,
+                           compounds_to_match_path=NEW_COMPOUNDS_PATH,
                            output_path=self.output_folder,
                            tolerance=0.0015)
 
@@ -54,7 +97,7 @@ class TestMSDataMatcher(MSDataMatcherTestCase, TestCase):
         shutil.rmtree(self.new_output_folder)
 
         with self.assertRaises(FileExistsError):
-            ms.output_path = os.path.join(TESTS_DATA_PATH, 'results_sample/')
+            ms.output_path = RESULTS_SAMPLE_PATH
 
         ms.generate_ms_results()
 
@@ -62,13 +105,13 @@ class TestMSDataMatcher(MSDataMatcherTestCase, TestCase):
         with self.assertRaises(FileNotFoundError):
             ms.ms_data_path = 'not_existing_path.tsv'
 
-        ms.ms_data_path = os.path.join(TESTS_DATA_PATH, 'ms_data_sample/ms_data_subsample.tsv')
+        ms.ms_data_path = MS_DATA_SUBSAMPLE_PATH
 
         _ = ms.compounds_to_match
         with self.assertRaises(FileNotFoundError):
             ms.compounds_to_match = 'not_existing_path.tsv'
 
-        ms.compounds_to_match = os.path.join(TESTS_DATA_PATH, 'new_compounds_sample/new_compounds_subsample.tsv')
+        ms.compounds_to_match = NEW_COMPOUNDS_SUBSAMPLE_PATH
 
         tl = ms.tolerance
         ms.tolerance = 0.0015 + tl